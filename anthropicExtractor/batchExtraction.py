@@ -0,0 +1,521 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+
+import pdfSplitter
+import promptCachePDF as pcp
+import tokenCounter
+from langchain_chroma import Chroma
+from manifest import Manifest, file_hash
+
+# Requests and base64 payload per batch, below the Message Batches API limits
+BATCH_MAX_REQUESTS = 10000
+BATCH_MAX_BYTES = 32 * 1024 * 1024
+# Seconds between status checks of a submitted batch
+POLL_INTERVAL = 60
+
+STATE_PATH = "/workspace/legalAgent/anthropicExtractor/batches.json"
+
+
+class BatchState:
+    """
+    Persistent record of the submitted batches and the results already processed.
+
+    Every batch maps its custom ids (the PDF content hashes) to the PDF paths,
+    so a run that stops while waiting for, or while processing, a batch can be
+    resumed from the batch id without submitting the documents again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.batches = {}
+        if os.path.exists(path):
+            with open(path) as state_file:
+                self.batches = json.load(state_file)["batches"]
+
+    def add(self, batch_id, requests):
+        """
+        Record a submitted batch.
+
+        Args:
+            batch_id (str): The id returned by the API.
+            requests (dict): The PDF path of every custom id in the batch.
+        """
+        self.batches[batch_id] = {"requests": requests, "done": [], "ended": False}
+        self.save()
+
+    def mark_done(self, batch_id, custom_id):
+        self.batches[batch_id]["done"].append(custom_id)
+        self.save()
+
+    def finish(self, batch_id):
+        self.batches[batch_id]["ended"] = True
+        self.save()
+
+    def open_batches(self):
+        """
+        The ids of the batches whose results are not fully processed.
+        """
+        return [
+            batch_id for batch_id, batch in self.batches.items() if not batch["ended"]
+        ]
+
+    def in_flight(self):
+        """
+        The custom ids of every request in an open batch.
+        """
+        return {
+            custom_id
+            for batch_id in self.open_batches()
+            for custom_id in self.batches[batch_id]["requests"]
+        }
+
+    def done(self):
+        """
+        The custom ids of every processed result.
+        """
+        return {
+            custom_id for batch in self.batches.values() for custom_id in batch["done"]
+        }
+
+    def save(self):
+        # Write then rename, so a crash never leaves a truncated state file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as state_file:
+            json.dump({"batches": self.batches}, state_file, indent=4)
+        os.replace(tmp_path, self.path)
+
+
+def pending_documents(folder_path, state, manifest=None):
+    """
+    The PDFs to submit, keyed by content hash.
+
+    Documents already waiting in an open batch are skipped. Without a manifest,
+    documents with a processed result in the state file are skipped as well.
+
+    Args:
+        folder_path (str): The folder containing the PDFs.
+        state (BatchState): The batch state.
+        manifest (Manifest): Optional ingestion manifest.
+
+    Returns:
+        dict: The PDF path of every custom id to submit.
+    """
+    if manifest:
+        manifest.sync_folder(folder_path)
+        pcp.remove_tombstones(manifest)
+        documents = {
+            row["content_hash"]: row["path"] for row in manifest.pending("extraction")
+        }
+        skip = state.in_flight()
+    else:
+        documents = {
+            file_hash(os.path.join(folder_path, pdf_file)): os.path.join(
+                folder_path, pdf_file
+            )
+            for pdf_file in sorted(os.listdir(folder_path))
+            if pdf_file.lower().endswith(".pdf")
+        }
+        skip = state.in_flight() | state.done()
+    return {
+        custom_id: path
+        for custom_id, path in documents.items()
+        if custom_id not in skip
+    }
+
+
+def extract_oversized(documents, manifest=None):
+    """
+    Extract the PDFs too long for one request synchronously, split into page
+    ranges, and leave the others for the batches.
+
+    Args:
+        documents (dict): The PDF path of every custom id to submit.
+        manifest (Manifest): Optional ingestion manifest.
+
+    Returns:
+        dict: The PDF path of every custom id that still has to be submitted.
+    """
+    remaining = {}
+    for custom_id, path in documents.items():
+        pdf_bytes = pcp.read_pdf(path)
+        if not pdfSplitter.needs_split(tokenCounter.measure_pdf(pdf_bytes, pcp.client)):
+            remaining[custom_id] = path
+            continue
+        print(f"---TOO LONG FOR A BATCH REQUEST, SPLITTING: {path}---")
+        output_data = pdfSplitter.extract_pdf(path, pdf_bytes)
+        index_output(custom_id, path, output_data, pdf_bytes, manifest)
+    return remaining
+
+
+def index_output(custom_id, path, output_data, pdf_bytes, manifest=None):
+    """
+    Record a saved extraction output in the manifest and index the PDF.
+    """
+    if manifest:
+        manifest.mark_done(
+            custom_id,
+            "extraction",
+            name=output_data["name"],
+            output_path=pcp.output_path_for(output_data["name"]),
+        )
+        pcp.index_document(
+            manifest, {"path": path, "content_hash": custom_id}, output_data, pdf_bytes
+        )
+    else:
+        pcp.add_document(path, output_data, pdf_bytes)
+
+
+def submit_batches(
+    client,
+    documents,
+    state,
+    max_requests=BATCH_MAX_REQUESTS,
+    max_bytes=BATCH_MAX_BYTES,
+):
+    """
+    Submit the extraction requests of many PDFs as Message Batches.
+
+    Every request carries the same cached system prompt and one PDF document
+    block. A new batch is started whenever the request count or payload size
+    would exceed the limits.
+
+    Args:
+        client (Anthropic): The Anthropic client, or a FixtureClient.
+        documents (dict): The PDF path of every custom id to submit.
+        state (BatchState): The batch state the submitted batches are added to.
+        max_requests (int): Maximum requests per batch.
+        max_bytes (int): Maximum base64 payload bytes per batch.
+
+    Returns:
+        list: The ids of the submitted batches.
+    """
+    batch_ids = []
+    requests = []
+    paths = {}
+    size = 0
+
+    def submit():
+        batch = client.beta.messages.batches.create(requests=requests, betas=pcp.BETAS)
+        state.add(batch.id, dict(paths))
+        batch_ids.append(batch.id)
+        print(f"---SUBMITTED BATCH {batch.id} with {len(requests)} requests---")
+
+    for custom_id, path in documents.items():
+        pdf_data = pcp.encode_pdf(pcp.read_pdf(path))
+        if requests and (
+            len(requests) >= max_requests or size + len(pdf_data) > max_bytes
+        ):
+            submit()
+            requests, paths, size = [], {}, 0
+        requests.append(
+            {"custom_id": custom_id, "params": pcp.extraction_params(pdf_data)}
+        )
+        paths[custom_id] = path
+        size += len(pdf_data)
+    if requests:
+        submit()
+    return batch_ids
+
+
+def wait_for_batch(client, batch_id, poll_interval=POLL_INTERVAL):
+    """
+    Poll a batch until it has ended.
+
+    Args:
+        client (Anthropic): The Anthropic client, or a FixtureClient.
+        batch_id (str): The batch id.
+        poll_interval (float): Seconds between status checks.
+
+    Returns:
+        BetaMessageBatch: The ended batch.
+    """
+    while True:
+        batch = client.beta.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        print(
+            f"---BATCH {batch_id}: {batch.processing_status}, "
+            f"{counts.processing} processing, {counts.succeeded} succeeded, "
+            f"{counts.errored + counts.canceled + counts.expired} failed---"
+        )
+        if batch.processing_status == "ended":
+            return batch
+        time.sleep(poll_interval)
+
+
+def process_results(client, batch_id, state, manifest=None):
+    """
+    Save and index every succeeded result of an ended batch.
+
+    Results are streamed from the API and handed to the same output and
+    indexing functions as the synchronous extraction. A result cut off at
+    max_tokens is not repaired: its PDF is split and extracted again
+    synchronously. Results already processed by an earlier run are skipped,
+    and failed requests are left for the next run to submit again.
+
+    Args:
+        client (Anthropic): The Anthropic client, or a FixtureClient.
+        batch_id (str): The id of an ended batch.
+        state (BatchState): The batch state.
+        manifest (Manifest): Optional ingestion manifest.
+
+    Returns:
+        dict: The number of succeeded and failed results.
+    """
+    batch = state.batches[batch_id]
+    done = set(batch["done"])
+    report = {"succeeded": 0, "failed": 0}
+
+    for response in client.beta.messages.batches.results(batch_id):
+        custom_id = response.custom_id
+        if custom_id in done:
+            continue
+        path = batch["requests"][custom_id]
+        if response.result.type != "succeeded":
+            report["failed"] += 1
+            print(f"---BATCH REQUEST FAILED: {path} ({response.result.type})---")
+            continue
+
+        message = response.result.message
+        # Batch requests are billed at half the token prices
+        pcp.telemetry.record(message, label="batch", price_factor=0.5)
+        pdf_bytes = pcp.read_pdf(path)
+        parts = pdfSplitter.extract_range(
+            pdf_bytes, 0, pcp.llm_extraction, message=message
+        )
+        output_data = pdfSplitter.save_parts(path, parts)
+        index_output(custom_id, path, output_data, pdf_bytes, manifest)
+        state.mark_done(batch_id, custom_id)
+        report["succeeded"] += 1
+
+    state.finish(batch_id)
+    return report
+
+
+def batch_pdf_processing(
+    folder_path,
+    manifest_path=None,
+    state_path=STATE_PATH,
+    batch_id=None,
+    client=None,
+    poll_interval=POLL_INTERVAL,
+):
+    """
+    Extract and index every PDF in a folder through the Message Batches API.
+
+    Open batches from an earlier run are resumed first, then the remaining PDFs
+    are submitted, and each batch is polled and its results processed. PDFs too
+    long for one request are split and extracted synchronously instead.
+
+    Args:
+        folder_path (str): The folder containing the PDFs.
+        manifest_path (str): Optional manifest database. When given, only new or
+            changed PDFs are submitted.
+        state_path (str): The batch state file.
+        batch_id (str): Only resume this batch, without submitting anything.
+        client (Anthropic): The client to use, the extractor's client by default.
+        poll_interval (float): Seconds between status checks.
+
+    Returns:
+        dict: The number of submitted batches, documents extracted in page
+            ranges instead, and succeeded and failed results.
+    """
+    client = client or pcp.client
+    split = 0
+    state = BatchState(state_path)
+    manifest = Manifest(manifest_path) if manifest_path else None
+
+    if batch_id:
+        if batch_id not in state.batches:
+            raise ValueError(f"Unknown batch {batch_id!r}, not in {state_path}")
+        batch_ids = [batch_id]
+        submitted = []
+    else:
+        batch_ids = state.open_batches()
+        if batch_ids:
+            print(f"---RESUMING {len(batch_ids)} BATCHES---")
+        documents = pending_documents(folder_path, state, manifest)
+        # Fixture runs replay every document from its saved output
+        if not isinstance(client, FixtureClient):
+            remaining = extract_oversized(documents, manifest)
+            split = len(documents) - len(remaining)
+            documents = remaining
+        submitted = submit_batches(client, documents, state)
+        batch_ids += submitted
+
+    report = {"submitted": len(submitted), "split": split, "succeeded": 0, "failed": 0}
+    for open_batch in batch_ids:
+        wait_for_batch(client, open_batch, poll_interval)
+        for key, count in process_results(client, open_batch, state, manifest).items():
+            report[key] += count
+
+    print(
+        f"---BATCHES DONE: {report['submitted']} submitted, "
+        f"{report['split']} split, {report['succeeded']} succeeded, "
+        f"{report['failed']} failed---"
+    )
+    pcp.telemetry.report()
+    return report
+
+
+class FixtureClient:
+    """
+    Offline stand-in for the Message Batches API.
+
+    Results are replayed from recorded extraction JSONs, keyed by custom id, so
+    the batch mode can be run without network access. A batch reports
+    in_progress for the first polls and then ends.
+    """
+
+    def __init__(self, fixtures, polls_until_ended=1):
+        self.fixtures = fixtures
+        self.polls_until_ended = polls_until_ended
+        self.submitted = {}
+        self._polls = {}
+        self.beta = SimpleNamespace(messages=SimpleNamespace(batches=self))
+
+    def create(self, requests, **kwargs):
+        batch_id = f"msgbatch_fixture_{uuid.uuid4().hex[:12]}"
+        self.submitted[batch_id] = [request["custom_id"] for request in requests]
+        self._polls[batch_id] = 0
+        return SimpleNamespace(id=batch_id, processing_status="in_progress")
+
+    def retrieve(self, batch_id, **kwargs):
+        custom_ids = self.submitted[batch_id]
+        self._polls[batch_id] += 1
+        ended = self._polls[batch_id] > self.polls_until_ended
+        succeeded = sum(custom_id in self.fixtures for custom_id in custom_ids)
+        return SimpleNamespace(
+            id=batch_id,
+            processing_status="ended" if ended else "in_progress",
+            request_counts=SimpleNamespace(
+                processing=0 if ended else len(custom_ids),
+                succeeded=succeeded if ended else 0,
+                errored=len(custom_ids) - succeeded if ended else 0,
+                canceled=0,
+                expired=0,
+            ),
+        )
+
+    def results(self, batch_id, **kwargs):
+        for custom_id in self.submitted[batch_id]:
+            if custom_id not in self.fixtures:
+                result = SimpleNamespace(type="errored", message=None)
+            else:
+                result = SimpleNamespace(
+                    type="succeeded",
+                    message=SimpleNamespace(
+                        content=[
+                            SimpleNamespace(type="text", text=self.fixtures[custom_id])
+                        ],
+                        stop_reason="end_turn",
+                        usage=SimpleNamespace(
+                            input_tokens=0,
+                            cache_creation_input_tokens=0,
+                            cache_read_input_tokens=0,
+                            output_tokens=len(self.fixtures[custom_id]) // 4,
+                        ),
+                    ),
+                )
+            yield SimpleNamespace(custom_id=custom_id, result=result)
+
+
+def use_output_root(output_root):
+    """
+    Send the outputs and chunks of this process to a separate folder.
+
+    Fixture runs write here instead of the production output folder and Chroma
+    collection, and keep their manifest and batch state next to them.
+
+    Args:
+        output_root (str): The folder, created if needed.
+
+    Returns:
+        tuple: The manifest and batch state paths under output_root.
+    """
+    os.makedirs(output_root, exist_ok=True)
+    pcp.OUTPUT_FOLDER = os.path.join(output_root, "output")
+    pcp.vector_db = Chroma(
+        collection_name="rag-chroma",
+        persist_directory=os.path.join(output_root, "chromaVDB"),
+        embedding_function=pcp.embeddings,
+    )
+    return (
+        os.path.join(output_root, "manifest.sqlite3"),
+        os.path.join(output_root, "batches.json"),
+    )
+
+
+def fixtures_from_outputs(folder_path, output_folder=pcp.OUTPUT_FOLDER):
+    """
+    Recorded results for the PDFs whose extraction JSON shares their file name.
+
+    Args:
+        folder_path (str): The folder containing the PDFs.
+        output_folder (str): The folder of recorded extraction JSONs.
+
+    Returns:
+        dict: The recorded JSON text of every matched PDF's content hash.
+    """
+    fixtures = {}
+    for pdf_file in sorted(os.listdir(folder_path)):
+        name, extension = os.path.splitext(pdf_file)
+        output_path = os.path.join(output_folder, f"{name}.json")
+        if extension.lower() == ".pdf" and os.path.exists(output_path):
+            with open(output_path) as json_file:
+                fixtures[file_hash(os.path.join(folder_path, pdf_file))] = (
+                    json_file.read()
+                )
+    return fixtures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bulk extraction of circular PDFs through Message Batches."
+    )
+    parser.add_argument(
+        "folder",
+        nargs="?",
+        default="/workspace/legalAgent/anthropicExtractor/circulars",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=pcp.MANIFEST_PATH,
+        help="Manifest database for incremental runs, pass an empty string to process everything",
+    )
+    parser.add_argument("--state", default=STATE_PATH)
+    parser.add_argument("--batch-id", help="Resume a single submitted batch")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument(
+        "--fixtures",
+        metavar="OUTPUT_FOLDER",
+        help="Replay recorded extraction JSONs instead of calling the API",
+    )
+    parser.add_argument(
+        "--output-root",
+        help="Folder for the outputs, chunks, manifest and state of a fixture run, "
+        "a new temporary folder by default",
+    )
+    args = parser.parse_args()
+
+    client = None
+    if args.fixtures:
+        client = FixtureClient(fixtures_from_outputs(args.folder, args.fixtures))
+        output_root = args.output_root or tempfile.mkdtemp(prefix="batchFixtures-")
+        manifest_path, args.state = use_output_root(output_root)
+        if args.manifest:
+            args.manifest = manifest_path
+        print(f"---FIXTURE RUN, WRITING TO {output_root}---")
+
+    batch_pdf_processing(
+        args.folder,
+        manifest_path=args.manifest or None,
+        state_path=args.state,
+        batch_id=args.batch_id,
+        client=client,
+        poll_interval=args.poll_interval,
+    )
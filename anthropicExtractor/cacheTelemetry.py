@@ -0,0 +1,169 @@
+import threading
+
+from tokenCounter import CACHE_READ_PRICE, CACHE_WRITE_PRICE, INPUT_PRICE, OUTPUT_PRICE
+
+
+class CacheTelemetry:
+    """
+    Prompt cache, latency and cost metrics of Anthropic requests.
+
+    Every response's usage is recorded: uncached input tokens, tokens written
+    to the prompt cache, tokens read from it and output tokens. Safe to record
+    from several threads.
+
+    A telemetry with a parent also adds its requests to the parent, e.g. the
+    metrics of one document session to those of the whole process.
+    """
+
+    def __init__(self, parent=None):
+        self._lock = threading.Lock()
+        self.parent = parent
+        self.requests = []
+
+    def record(self, message, seconds=None, label="extraction", price_factor=1.0):
+        """
+        Record the usage of one response and print it.
+
+        Args:
+            message (Message): The Anthropic response.
+            seconds (float): The request latency, None when unknown (batches).
+            label (str): The kind of request, shown in the log line.
+            price_factor (float): Multiplier of the token prices, e.g. 0.5 for
+                Message Batches requests.
+
+        Returns:
+            dict: The request's tokens, latency and cost.
+        """
+        usage = message.usage
+        request = {
+            "label": label,
+            "input_tokens": usage.input_tokens,
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+            "output_tokens": usage.output_tokens,
+            "seconds": seconds,
+        }
+        request["cost"], request["uncached_cost"] = (
+            cost * price_factor for cost in _costs(request)
+        )
+        telemetry = self
+        while telemetry is not None:
+            with telemetry._lock:
+                telemetry.requests.append(request)
+            telemetry = telemetry.parent
+
+        latency = f" {seconds:.2f}s" if seconds is not None else ""
+        print(
+            f"---USAGE {label}: input={request['input_tokens']} "
+            f"cache_write={request['cache_write_tokens']} "
+            f"cache_read={request['cache_read_tokens']} "
+            f"output={request['output_tokens']}{latency} "
+            f"${request['cost']:.4f}---"
+        )
+        return request
+
+    def summary(self):
+        """
+        Aggregate the recorded requests.
+
+        Returns:
+            dict: Request count, token totals, the share of requests that read
+                from the cache, the share of prompt tokens served from it,
+                latency mean / p50 / p95, the cost, and the savings over
+                sending the same prompts uncached.
+        """
+        with self._lock:
+            requests = list(self.requests)
+
+        totals = {
+            key: sum(request[key] for request in requests)
+            for key in (
+                "input_tokens",
+                "cache_write_tokens",
+                "cache_read_tokens",
+                "output_tokens",
+                "cost",
+                "uncached_cost",
+            )
+        }
+        prompt_tokens = (
+            totals["input_tokens"]
+            + totals["cache_write_tokens"]
+            + totals["cache_read_tokens"]
+        )
+        latencies = sorted(
+            request["seconds"] for request in requests if request["seconds"] is not None
+        )
+        return {
+            "requests": len(requests),
+            **totals,
+            "hit_rate": (
+                sum(request["cache_read_tokens"] > 0 for request in requests)
+                / len(requests)
+                if requests
+                else 0.0
+            ),
+            "cached_share": (
+                totals["cache_read_tokens"] / prompt_tokens if prompt_tokens else 0.0
+            ),
+            "mean_seconds": (sum(latencies) / len(latencies) if latencies else None),
+            "p50_seconds": _percentile(latencies, 0.50),
+            "p95_seconds": _percentile(latencies, 0.95),
+            "savings": totals["uncached_cost"] - totals["cost"],
+        }
+
+    def report(self):
+        """
+        Print the aggregate metrics.
+        """
+        summary = self.summary()
+        if not summary["requests"]:
+            return
+        print("---PROMPT CACHE SUMMARY---")
+        print(
+            f"{summary['requests']} requests, cache hits on "
+            f"{summary['hit_rate']:.1%} of them"
+        )
+        print(
+            f"Prompt tokens: {summary['input_tokens']} uncached, "
+            f"{summary['cache_write_tokens']} written to the cache, "
+            f"{summary['cache_read_tokens']} read from it "
+            f"({summary['cached_share']:.1%})"
+        )
+        print(f"Output tokens: {summary['output_tokens']}")
+        if summary["mean_seconds"] is not None:
+            print(
+                f"Latency: mean {summary['mean_seconds']:.2f}s, "
+                f"p50 {summary['p50_seconds']:.2f}s, "
+                f"p95 {summary['p95_seconds']:.2f}s"
+            )
+        print(
+            f"Cost: ${summary['cost']:.4f}, "
+            f"${summary['savings']:.4f} saved by prompt caching"
+        )
+
+
+def _costs(request):
+    output = request["output_tokens"] * OUTPUT_PRICE
+    cost = (
+        request["input_tokens"] * INPUT_PRICE
+        + request["cache_write_tokens"] * CACHE_WRITE_PRICE
+        + request["cache_read_tokens"] * CACHE_READ_PRICE
+        + output
+    )
+    uncached = (
+        request["input_tokens"]
+        + request["cache_write_tokens"]
+        + request["cache_read_tokens"]
+    ) * INPUT_PRICE + output
+    return cost / 1e6, uncached / 1e6
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# Shared by every extraction request of the process
+telemetry = CacheTelemetry()
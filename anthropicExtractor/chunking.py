@@ -0,0 +1,124 @@
+import re
+import string
+
+from langchain_core.documents import Document
+from langchain_text_splitters import (
+    MarkdownHeaderTextSplitter,
+    RecursiveCharacterTextSplitter,
+)
+
+# Characters per chunk and characters shared by consecutive chunks of a section
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+# Markdown headers that start a new section, outermost first
+HEADERS = [("#", "h1"), ("##", "h2"), ("###", "h3")]
+# Chunks embedded and written to the vector store per call
+EMBED_BATCH_SIZE = 64
+
+LEVELS = [level for _, level in HEADERS]
+
+
+def clean_markdown(text):
+    """
+    Strip image placeholders, non-printable characters, blank lines and URLs
+    from Docling markdown.
+    """
+    printable = set(string.printable)
+    text = text.replace("<!-- image -->", "")
+    text = "".join(filter(lambda x: x in printable, text))
+    text = re.sub(r"\n+", "\n", text)
+    text = re.sub(r"https?://\S+|www\.\S+", "", text)
+    return text
+
+
+def page_markdown(document):
+    """
+    Export a converted document to cleaned markdown, one string per page.
+
+    Args:
+        document (DoclingDocument): The Docling conversion result document.
+
+    Returns:
+        list: (page number, markdown) pairs in page order. The page number is
+            None when the document has no page layout.
+    """
+    page_numbers = sorted(document.pages) or [None]
+    return [
+        (page_no, clean_markdown(document.export_to_markdown(page_no=page_no)))
+        for page_no in page_numbers
+    ]
+
+
+def chunk_document(
+    document, metadata, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+):
+    """
+    Split a converted document into section-aware, page-numbered chunks.
+
+    Each page is split on markdown headers first, and long sections are then
+    split by size with overlap. Every chunk starts with its section path, and a
+    section that runs over a page break keeps its headers on the next page.
+
+    Args:
+        document (DoclingDocument): The Docling conversion result document.
+        metadata (dict): Metadata copied to every chunk, e.g. name and date.
+        chunk_size (int): The maximum characters per chunk.
+        chunk_overlap (int): The characters shared by consecutive chunks.
+
+    Returns:
+        list: The chunks, with page, section and chunk index metadata.
+    """
+    header_splitter = MarkdownHeaderTextSplitter(HEADERS)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+
+    chunks = []
+    headers = {}
+    for page_no, markdown in page_markdown(document):
+        if not markdown.strip():
+            continue
+        for section in header_splitter.split_text(markdown):
+            headers = _carry_headers(headers, section.metadata)
+            title = " > ".join(headers[level] for level in LEVELS if level in headers)
+            for text in text_splitter.split_text(section.page_content):
+                chunks.append(
+                    Document(
+                        # The section path gives every chunk its context
+                        page_content=f"{title}\n{text}" if title else text,
+                        metadata={
+                            **metadata,
+                            "page": page_no if page_no is not None else 0,
+                            "section": title,
+                            "chunk": len(chunks),
+                        },
+                    )
+                )
+    return chunks
+
+
+def add_chunks(vector_db, chunks, batch_size=EMBED_BATCH_SIZE):
+    """
+    Embed and write chunks to the vector store in batches.
+
+    Args:
+        vector_db (VectorStore): The vector store.
+        chunks (list): The chunks to add.
+        batch_size (int): Chunks embedded per call.
+
+    Returns:
+        list: The ids of the added chunks, in order.
+    """
+    ids = []
+    for i in range(0, len(chunks), batch_size):
+        ids.extend(vector_db.add_documents(documents=chunks[i : i + batch_size]))
+    return ids
+
+
+def _carry_headers(carried, headers):
+    # Text before the first header of a page continues the previous section
+    if not headers:
+        return carried
+    top = min(LEVELS.index(level) for level in headers)
+    kept = {level: text for level, text in carried.items() if LEVELS.index(level) < top}
+    return {**kept, **headers}
@@ -0,0 +1,107 @@
+import argparse
+import base64
+import time
+
+import anthropic
+from cacheTelemetry import CacheTelemetry, telemetry
+from dotenv import load_dotenv
+from extractionRequest import BETAS, extraction_params
+
+load_dotenv()
+
+# System prompt of every session request. It says nothing about the output
+# format, so questions are answered in prose and only extract() asks for JSON.
+SESSION_SYSTEM = """
+You are an advanced document analysis AI specializing in official regulatory documents.
+Follow the instructions that come after the document, and base every answer only on its text.
+"""
+
+
+class DocumentSession:
+    """
+    Several requests over one PDF that share a cached prompt prefix.
+
+    Every request starts with the same session system prompt and the PDF
+    document block, which is marked for prompt caching. The extraction
+    instructions or the question follow the document, so they are not part of
+    the cached prefix. The first request writes the prefix to the cache, and
+    every later extraction pass or question within the cache lifetime reads it
+    instead of sending the whole PDF through the model again. Each request sees
+    only the document and its own instructions, so follow-ups do not grow the
+    prompt.
+    """
+
+    def __init__(self, pdf_bytes, client=None, max_tokens=1024):
+        self.client = client or anthropic.Anthropic()
+        self.max_tokens = max_tokens
+        self.telemetry = CacheTelemetry(parent=telemetry)
+
+        params = extraction_params(base64.standard_b64encode(pdf_bytes).decode("utf-8"))
+        self.model = params["model"]
+        self.extraction_instructions = "".join(
+            block["text"] for block in params["system"]
+        )
+        self.document = {
+            **params["messages"][0]["content"][0],
+            "cache_control": {"type": "ephemeral"},
+        }
+
+    def extract(self):
+        """
+        Run the standard extraction over the document.
+
+        Returns:
+            Message: The Anthropic response holding the extraction JSON.
+        """
+        return self._create(
+            [self.document, {"type": "text", "text": self.extraction_instructions}],
+            "session extraction",
+        )
+
+    def ask(self, question, max_tokens=None):
+        """
+        Ask a question or run a follow-up extraction pass over the document.
+
+        Args:
+            question (str): The question or instruction.
+            max_tokens (int): The output limit, the session's by default.
+
+        Returns:
+            str: The answer text.
+        """
+        message = self._create(
+            [self.document, {"type": "text", "text": question}],
+            "session question",
+            max_tokens,
+        )
+        return message.content[0].text
+
+    def _create(self, content, label, max_tokens=None):
+        start = time.perf_counter()
+        message = self.client.beta.messages.create(
+            model=self.model,
+            betas=BETAS,
+            max_tokens=max_tokens or self.max_tokens,
+            system=[{"type": "text", "text": SESSION_SYSTEM}],
+            messages=[{"role": "user", "content": content}],
+        )
+        elapsed = time.perf_counter() - start
+        self.telemetry.record(message, elapsed, label)
+        return message
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Ask several questions about one circular over a cached PDF."
+    )
+    parser.add_argument("pdf")
+    parser.add_argument("questions", nargs="+")
+    args = parser.parse_args()
+
+    with open(args.pdf, "rb") as pdf_file:
+        session = DocumentSession(pdf_file.read())
+
+    for question in args.questions:
+        print(f"Q: {question}")
+        print(f"A: {session.ask(question)}")
+    session.telemetry.report()
@@ -0,0 +1,88 @@
+# Model and beta features used by the extraction requests
+MODEL = "claude-3-5-sonnet-20241022"
+BETAS = ["pdfs-2024-09-25", "prompt-caching-2024-07-31"]
+
+
+def extraction_params(pdf_data):
+    """
+    The Messages API parameters of the extraction request for one PDF.
+
+    Shared by the synchronous calls, the Message Batches submissions and the
+    token counter, so all of them see the same cached system prompt.
+
+    Args:
+        pdf_data (str): The base64-encoded PDF.
+
+    Returns:
+        dict: The model, max_tokens, system and messages parameters.
+    """
+    return {
+        "model": MODEL,
+        "max_tokens": 1024,
+        "system": [
+            {
+                "type": "text",
+                "text": """
+                        You are an advanced document analysis AI specializing in extracting structured information from official regulatory documents.
+
+                        Task: Analyze the given document and generate a precise JSON structure with the following specifications:
+
+                        Output Requirements:
+                        - Use strict JSON formatting
+                        - Ensure all extracted information is verbatim from the source document
+                        - Maintain professional, neutral language
+                        - Be comprehensive yet concise
+
+                        Output Structure:
+                        {
+                            "name": "",
+                            "date_of_issue": "",
+                            "summary": "",
+                            "relations": {
+                                "document_name": "relationship_type"
+                            },
+                            "questions": []
+                        }
+
+                        1. Document Identification:
+                        - Capture the exact, full official name of the document which is the unique name at the top of the document excluding the title
+                        - Extract the precise date of issue
+
+                        2. Document Relations Extraction:
+                        - Identify all mentions of other documents within the text
+                        - Extract the full official name of the related document, remove any additional information like dates for example "Circular 123" instead of "Circular 123 dated 2024"
+                        - Determine their relationship of the extracted document to the current document using a single word. Examples: superseded, referenced, amended, invoked, replaced, cited
+
+                        3. Optimized Summary:
+                        - Create a concise yet comprehensive summary
+                        - Ensure the summary is rich in key terms and contextual information
+                        - Capture the core purpose, key regulatory changes, and fundamental implications of the document
+
+                        4. Factual Questions:
+                        - Generate questions that can be answered ONLY from the exact text of the document
+                        - Questions must be:
+                            * Directly answerable from the document's content
+                            * Specific and precise
+                            * Focused on factual details
+
+                        
+                    """,
+                "cache_control": {"type": "ephemeral"},
+            },
+        ],
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "document",
+                        "source": {
+                            "type": "base64",
+                            "media_type": "application/pdf",
+                            "data": pdf_data,
+                        },
+                    },
+                ],
+            }
+        ],
+    }
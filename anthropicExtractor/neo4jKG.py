@@ -1,6 +1,8 @@
 import json
 import os
+import time
 
+from manifest import Manifest
 from py2neo import Graph, Node, NodeMatcher, Relationship
 
 # Define Neo4j database connection parameters
@@ -8,17 +10,48 @@ URI = "bolt://localhost:7687"
 USER = "neo4j"
 PASSWORD = "yourpassword"
 
+# Manifest used for incremental graph updates
+MANIFEST_PATH = "/workspace/legalAgent/anthropicExtractor/manifest.sqlite3"
 
-def create_knowledge_graph(json_directory):
+# Number of rows sent per UNWIND transaction by the bulk loader
+BATCH_SIZE = 1000
+
+
+def create_knowledge_graph(
+    json_directory, manifest_path=None, bulk=True, batch_size=BATCH_SIZE, sync=False
+):
     """
     Create a knowledge graph from JSON files in the specified directory.
 
     Args:
         json_directory (str): The directory containing JSON files to be processed.
+        manifest_path (str): Optional ingestion manifest. When given, the graph is
+            updated in place: only documents whose graph stage is pending are
+            loaded and removed documents are dropped, instead of rebuilding the
+            whole graph.
+        bulk (bool): Load the documents with batched UNWIND transactions instead
+            of merging them one relation at a time.
+        batch_size (int): Number of rows per transaction for the bulk loader.
+        sync (bool): Diff the JSON files against the graph and apply only the
+            additions, changes and deletions, keeping the graph online.
     """
     # Connect to the Neo4j database
     graph = Graph(URI, auth=(USER, PASSWORD))
 
+    if manifest_path:
+        update_knowledge_graph(graph, Manifest(manifest_path))
+        bump_graph_version(graph)
+        return
+
+    if sync:
+        graph.run(
+            "CREATE CONSTRAINT IF NOT EXISTS FOR (d:GovernmentDocument) REQUIRE d.name IS UNIQUE"
+        )
+        sync_knowledge_graph(graph, read_documents(json_directory), batch_size)
+        bump_graph_version(graph)
+        print("Knowledge graph sync complete.")
+        return
+
     # Delete all existing nodes and relationships in the graph
     graph.delete_all()
 
@@ -27,6 +60,12 @@ def create_knowledge_graph(json_directory):
         "CREATE CONSTRAINT IF NOT EXISTS FOR (d:GovernmentDocument) REQUIRE d.name IS UNIQUE"
     )
 
+    if bulk:
+        bulk_load(graph, read_documents(json_directory), batch_size)
+        bump_graph_version(graph)
+        print("Knowledge graph creation complete.")
+        return
+
     # Initialize a NodeMatcher for finding existing nodes
     matcher = NodeMatcher(graph)
 
@@ -37,38 +76,387 @@ def create_knowledge_graph(json_directory):
             with open(file_path, "r") as file:
                 data = json.load(file)
 
-            # Create or merge the main document node
-            main_doc = Node(
-                "GovernmentDocument",
-                name=data["name"],
-                date_of_issue=data["date_of_issue"],
-                summary=data["summary"],
-                questions=data["questions"],
-            )
-            graph.merge(main_doc, "GovernmentDocument", "name")
-
-            # Iterate over related documents and their relationship types
-            for related_doc, relation_type in data["relations"].items():
-                # Check if the related document node already exists
-                existing_node = matcher.match(
-                    "GovernmentDocument", name=related_doc
-                ).first()
-
-                if existing_node:
-                    related_node = existing_node
-                else:
-                    # Create a new node for the related document if it doesn't exist
-                    related_node = Node("GovernmentDocument", name=related_doc)
-                    graph.create(related_node)
-
-                # Create or merge the relationship between the main document and the related document
-                relation = Relationship(main_doc, relation_type.upper(), related_node)
-                graph.merge(relation)
+            merge_document(graph, matcher, data)
 
             print(f"Processed {data['name']}")
 
+    bump_graph_version(graph)
     print("Knowledge graph creation complete.")
 
 
+def bump_graph_version(graph):
+    """
+    Give the graph a new version after a load.
+
+    The version lives on a single GraphMeta node. Readers that cache graph query
+    results compare it to the version they cached under and drop stale results.
+
+    Args:
+        graph (Graph): The Neo4j graph.
+    """
+    graph.run("""
+        MERGE (m:GraphMeta {key: 'graph'})
+        SET m.version = randomUUID(), m.updated_at = datetime()
+        """)
+
+
+def merge_document(graph, matcher, data):
+    """
+    Merge one extracted document and its relations into the graph.
+
+    Args:
+        graph (Graph): The Neo4j graph.
+        matcher (NodeMatcher): Matcher used to find existing related documents.
+        data (dict): The extraction output of the document.
+    """
+    # Create or merge the main document node
+    main_doc = Node(
+        "GovernmentDocument",
+        name=data["name"],
+        date_of_issue=data["date_of_issue"],
+        summary=data["summary"],
+        questions=data.get("questions", []),
+    )
+    graph.merge(main_doc, "GovernmentDocument", "name")
+
+    # Iterate over related documents and their relationship types
+    for related_doc, relation_type in data["relations"].items():
+        # Check if the related document node already exists
+        existing_node = matcher.match("GovernmentDocument", name=related_doc).first()
+
+        if existing_node:
+            related_node = existing_node
+        else:
+            # Create a new node for the related document if it doesn't exist
+            related_node = Node("GovernmentDocument", name=related_doc)
+            graph.create(related_node)
+
+        # Create or merge the relationship between the main document and the related document
+        relation = Relationship(main_doc, relation_type.upper(), related_node)
+        graph.merge(relation)
+
+
+def read_documents(json_directory):
+    """
+    Load every extraction JSON file in a directory.
+
+    Args:
+        json_directory (str): The directory containing JSON files.
+
+    Returns:
+        list: The extraction output of each document.
+    """
+    documents = []
+    for filename in sorted(os.listdir(json_directory)):
+        if filename.endswith(".json"):
+            with open(os.path.join(json_directory, filename), "r") as file:
+                documents.append(json.load(file))
+    return documents
+
+
+def group_documents(documents):
+    """
+    Group extraction outputs into document nodes and typed edges.
+
+    Args:
+        documents (list): The extraction outputs.
+
+    Returns:
+        tuple: The main document properties keyed by name, the names of
+            documents that are only referenced, and the edges keyed by
+            relationship type as a set of (source, target) pairs.
+    """
+    main_docs = {}
+    edges = {}
+    for data in documents:
+        main_docs[data["name"]] = {
+            "name": data["name"],
+            "date_of_issue": data["date_of_issue"],
+            "summary": data["summary"],
+            "questions": data.get("questions", []),
+        }
+        for related_doc, relation_type in data["relations"].items():
+            edges.setdefault(relation_type.upper(), set()).add(
+                (data["name"], related_doc)
+            )
+
+    related_names = {target for typed in edges.values() for _, target in typed}
+    related_only = sorted(related_names - main_docs.keys())
+    return main_docs, related_only, edges
+
+
+MERGE_DOCUMENTS_QUERY = """
+UNWIND $rows AS row
+MERGE (d:GovernmentDocument {name: row.name})
+SET d.date_of_issue = row.date_of_issue,
+    d.summary = row.summary,
+    d.questions = row.questions
+"""
+
+MERGE_RELATED_QUERY = """
+UNWIND $rows AS name
+MERGE (:GovernmentDocument {name: name})
+"""
+
+MERGE_EDGES_QUERY = """
+UNWIND $rows AS row
+MATCH (a:GovernmentDocument {{name: row.source}})
+MATCH (b:GovernmentDocument {{name: row.target}})
+MERGE (a)-[:{relation_type}]->(b)
+"""
+
+
+def _edge_rows(pairs):
+    return [{"source": source, "target": target} for source, target in sorted(pairs)]
+
+
+def bulk_load(graph, documents, batch_size=BATCH_SIZE):
+    """
+    Write documents and relations with batched UNWIND ... MERGE transactions.
+
+    Nodes and edges are grouped up front so the whole load takes a handful of
+    round trips per batch instead of several per relation. Relationship types
+    cannot be parameterised in Cypher, so edges get one query per type.
+
+    Args:
+        graph (Graph): The Neo4j graph.
+        documents (list): The extraction outputs to load.
+        batch_size (int): Number of rows per transaction.
+
+    Returns:
+        dict: The number of nodes and edges written and the load time.
+    """
+    start = time.perf_counter()
+
+    main_docs, related_only, edges = group_documents(documents)
+
+    _run_batches(graph, MERGE_DOCUMENTS_QUERY, list(main_docs.values()), batch_size)
+    _run_batches(graph, MERGE_RELATED_QUERY, related_only, batch_size)
+    for relation_type, pairs in sorted(edges.items()):
+        _run_batches(
+            graph,
+            MERGE_EDGES_QUERY.format(relation_type=_quote(relation_type)),
+            _edge_rows(pairs),
+            batch_size,
+        )
+
+    elapsed = time.perf_counter() - start
+    node_count = len(main_docs) + len(related_only)
+    edge_count = sum(len(pairs) for pairs in edges.values())
+    print(
+        f"Loaded {node_count} nodes and {edge_count} edges in {elapsed:.2f}s "
+        f"({node_count / elapsed:.1f} nodes/s, {edge_count / elapsed:.1f} edges/s)"
+    )
+    return {"nodes": node_count, "edges": edge_count, "seconds": elapsed}
+
+
+def sync_knowledge_graph(graph, documents, batch_size=BATCH_SIZE):
+    """
+    Bring the graph in line with the extraction outputs without wiping it.
+
+    The current GovernmentDocument nodes and relations are diffed against the
+    documents, and only the differences are written, one transaction per batch:
+    new or changed documents, new related documents, added and removed
+    relations, documents whose JSON is gone and nodes nothing refers to anymore.
+    The graph stays queryable while the sync runs.
+
+    Args:
+        graph (Graph): The Neo4j graph.
+        documents (list): The extraction outputs.
+        batch_size (int): Number of rows per transaction.
+
+    Returns:
+        dict: The number of changes applied of each kind.
+    """
+    main_docs, related_only, edges = group_documents(documents)
+
+    documents_query = """
+        MATCH (d:GovernmentDocument)
+        RETURN d.name AS name, d.date_of_issue AS date_of_issue,
+               d.summary AS summary, d.questions AS questions
+        """
+    existing_docs = {
+        record["name"]: record for record in graph.run(documents_query).data()
+    }
+    existing_edges = {}
+    for record in graph.run("""
+        MATCH (a:GovernmentDocument)-[r]->(b:GovernmentDocument)
+        RETURN a.name AS source, type(r) AS type, b.name AS target
+        """).data():
+        existing_edges.setdefault(record["type"], set()).add(
+            (record["source"], record["target"])
+        )
+
+    changed_docs = [
+        props
+        for name, props in main_docs.items()
+        if name not in existing_docs
+        or any(existing_docs[name][key] != props[key] for key in props)
+    ]
+    new_related = [name for name in related_only if name not in existing_docs]
+    # Documents that lost their JSON but are still referenced become plain
+    # related-document nodes, everything else that is no longer wanted goes.
+    demoted_docs = [
+        name
+        for name in related_only
+        if name in existing_docs and existing_docs[name]["summary"] is not None
+    ]
+    stale_nodes = sorted(existing_docs.keys() - main_docs.keys() - set(related_only))
+
+    _run_batches(graph, MERGE_DOCUMENTS_QUERY, changed_docs, batch_size)
+    # A changed summary invalidates the embedding computed by Neo4jVector
+    _run_batches(
+        graph,
+        """
+        UNWIND $rows AS name
+        MATCH (d:GovernmentDocument {name: name})
+        REMOVE d.embedding
+        """,
+        [
+            props["name"]
+            for props in changed_docs
+            if props["name"] in existing_docs
+            and existing_docs[props["name"]]["summary"] != props["summary"]
+        ],
+        batch_size,
+    )
+    _run_batches(graph, MERGE_RELATED_QUERY, new_related, batch_size)
+
+    added_edges = 0
+    removed_edges = 0
+    for relation_type in sorted(edges.keys() | existing_edges.keys()):
+        wanted = edges.get(relation_type, set())
+        current = existing_edges.get(relation_type, set())
+        quoted = _quote(relation_type)
+        _run_batches(
+            graph,
+            MERGE_EDGES_QUERY.format(relation_type=quoted),
+            _edge_rows(wanted - current),
+            batch_size,
+        )
+        _run_batches(
+            graph,
+            f"""
+            UNWIND $rows AS row
+            MATCH (:GovernmentDocument {{name: row.source}})
+                  -[r:{quoted}]->
+                  (:GovernmentDocument {{name: row.target}})
+            DELETE r
+            """,
+            _edge_rows(current - wanted),
+            batch_size,
+        )
+        added_edges += len(wanted - current)
+        removed_edges += len(current - wanted)
+
+    _run_batches(
+        graph,
+        """
+        UNWIND $rows AS name
+        MATCH (d:GovernmentDocument {name: name})
+        REMOVE d.date_of_issue, d.summary, d.questions, d.embedding
+        """,
+        demoted_docs,
+        batch_size,
+    )
+    _run_batches(
+        graph,
+        """
+        UNWIND $rows AS name
+        MATCH (d:GovernmentDocument {name: name})
+        DETACH DELETE d
+        """,
+        stale_nodes,
+        batch_size,
+    )
+
+    changes = {
+        "documents_upserted": len(changed_docs),
+        "related_added": len(new_related),
+        "edges_added": added_edges,
+        "edges_removed": removed_edges,
+        "documents_demoted": len(demoted_docs),
+        "nodes_deleted": len(stale_nodes),
+    }
+    print(f"Graph sync applied {changes}")
+    return changes
+
+
+def _run_batches(graph, query, rows, batch_size):
+    for i in range(0, len(rows), batch_size):
+        tx = graph.begin()
+        tx.run(query, rows=rows[i : i + batch_size])
+        graph.commit(tx)
+
+
+def _quote(relation_type):
+    return "`" + relation_type.replace("`", "``") + "`"
+
+
+def remove_document(graph, name):
+    """
+    Remove an extracted document from the graph without touching its neighbours.
+
+    Its outgoing relations and extracted properties are dropped. The node itself
+    is only deleted when no other document still refers to it, otherwise it is
+    kept as a plain related-document node.
+
+    Args:
+        graph (Graph): The Neo4j graph.
+        name (str): The document name.
+    """
+    graph.run(
+        """
+        MATCH (d:GovernmentDocument {name: $name})
+        OPTIONAL MATCH (d)-[r]->()
+        DELETE r
+        WITH DISTINCT d
+        REMOVE d.date_of_issue, d.summary, d.questions, d.embedding
+        WITH d
+        WHERE NOT (d)--()
+        DELETE d
+        """,
+        name=name,
+    )
+
+
+def update_knowledge_graph(graph, manifest):
+    """
+    Apply the documents recorded in the manifest to the graph in place.
+
+    Args:
+        graph (Graph): The Neo4j graph.
+        manifest (Manifest): The ingestion manifest.
+    """
+    graph.run(
+        "CREATE CONSTRAINT IF NOT EXISTS FOR (d:GovernmentDocument) REQUIRE d.name IS UNIQUE"
+    )
+    matcher = NodeMatcher(graph)
+
+    # A tombstoned name a live document still has is not removed: an edited
+    # circular that keeps its name is merged below if pending, or is already in
+    # the graph from an earlier run.
+    for row in manifest.tombstones("graph"):
+        if row["name"] and not manifest.has_live_name(row["name"]):
+            remove_document(graph, row["name"])
+            print(f"Removed {row['name']}")
+        manifest.clear(row["content_hash"], "graph")
+
+    for row in manifest.pending("graph"):
+        with open(row["output_path"], "r") as file:
+            data = json.load(file)
+
+        merge_document(graph, matcher, data)
+        manifest.mark_done(row["content_hash"], "graph")
+
+        print(f"Processed {data['name']}")
+
+    print("Knowledge graph update complete.")
+
+
 # Call the function to create the knowledge graph from JSON files in the specified directory
-create_knowledge_graph("/workspace/legalAgent/anthropicExtractor/output")
+if __name__ == "__main__":
+    create_knowledge_graph(
+        "/workspace/legalAgent/anthropicExtractor/output",
+        manifest_path=MANIFEST_PATH,
+    )
@@ -0,0 +1,230 @@
+import argparse
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import pairwise
+
+import promptCachePDF as pcp
+import tokenCounter
+from pypdf import PdfReader, PdfWriter
+
+# Target input tokens of each page range of a split PDF
+PART_TOKENS = 30000
+# Page ranges of one PDF extracted at the same time
+SPLIT_WORKERS = 4
+
+
+def page_ranges(pages, tokens, part_tokens=PART_TOKENS):
+    """
+    Divide a PDF into consecutive page ranges of about part_tokens each.
+
+    Args:
+        pages (int): The page count.
+        tokens (int): The measured input tokens of the whole PDF.
+        part_tokens (int): The target tokens per range.
+
+    Returns:
+        list: (start, end) page indexes of each range, end excluded. The ranges
+            have near-equal page counts and at most SPLIT_PAGES pages.
+    """
+    tokens_per_page = max(1, tokens / max(1, pages))
+    per_part = max(1, min(tokenCounter.SPLIT_PAGES, int(part_tokens / tokens_per_page)))
+    parts = math.ceil(pages / per_part)
+    bounds = [round(i * pages / parts) for i in range(parts + 1)]
+    return list(pairwise(bounds))
+
+
+def page_range_pdf(reader, start, end):
+    """
+    Write a page range of a PDF as a PDF of its own.
+
+    Returns:
+        bytes: The sub-document.
+    """
+    writer = PdfWriter()
+    for page in reader.pages[start:end]:
+        writer.add_page(page)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def needs_split(measured):
+    """
+    Whether a measured PDF is too long for a single extraction request.
+
+    Args:
+        measured (dict): The pages and tokens from tokenCounter.measure_pdf.
+
+    Returns:
+        bool: True above tokenCounter.SPLIT_TOKENS or SPLIT_PAGES.
+    """
+    return (
+        measured["tokens"] > tokenCounter.SPLIT_TOKENS
+        or measured["pages"] > tokenCounter.SPLIT_PAGES
+    )
+
+
+def extract_range(pdf_bytes, first_page, llm, message=None):
+    """
+    Extract a PDF, halving it while the response is cut off at max_tokens.
+
+    A truncated response would otherwise be repaired into an incomplete
+    record, so each half is extracted again until the output fits or a single
+    page is left.
+
+    Args:
+        pdf_bytes (bytes): The PDF or page range.
+        first_page (int): The index of its first page in the whole document.
+        llm (callable): Sends a base64-encoded PDF and returns the message.
+        message (Message): The response for the whole range if it is already
+            known, e.g. a Message Batches result.
+
+    Returns:
+        list: (first page, extraction output) of each extracted part.
+    """
+    if message is None:
+        message = llm(pcp.encode_pdf(pdf_bytes))
+    if message.stop_reason == "max_tokens":
+        reader = PdfReader(BytesIO(pdf_bytes))
+        pages = len(reader.pages)
+        if pages > 1:
+            middle = pages // 2
+            print(
+                f"---TRUNCATED OUTPUT FOR PAGES {first_page + 1}-"
+                f"{first_page + pages}, SPLITTING---"
+            )
+            return extract_range(
+                page_range_pdf(reader, 0, middle), first_page, llm
+            ) + extract_range(
+                page_range_pdf(reader, middle, pages), first_page + middle, llm
+            )
+        print(f"---TRUNCATED OUTPUT FOR PAGE {first_page + 1}, REPAIRING---")
+    return [(first_page, pcp.parse_output(message))]
+
+
+def merge_outputs(parts, default_name=""):
+    """
+    Merge the extraction outputs of the page ranges of one document.
+
+    The result depends only on the page order. The name and date come from the
+    first range that has them, relations and questions are merged in page order
+    keeping the first occurrence, and the summaries are joined in page order.
+
+    Args:
+        parts (list): (first page, extraction output) of each range.
+        default_name (str): The name used when no range has one.
+
+    Returns:
+        dict: The name, date_of_issue, summary, relations and questions.
+    """
+    outputs = [output for _, output in sorted(parts, key=lambda part: part[0])]
+    relations = {}
+    questions = []
+    for output in outputs:
+        for related_doc, relation_type in (output.get("relations") or {}).items():
+            relations.setdefault(related_doc, relation_type)
+        for question in output.get("questions") or []:
+            if question not in questions:
+                questions.append(question)
+
+    return {
+        "name": next((o["name"] for o in outputs if o.get("name")), default_name),
+        "date_of_issue": next(
+            (o["date_of_issue"] for o in outputs if o.get("date_of_issue")), ""
+        ),
+        "summary": "\n\n".join(o["summary"] for o in outputs if o.get("summary")),
+        "relations": relations,
+        "questions": questions,
+    }
+
+
+def extract_pdf(
+    pdf_path,
+    pdf_bytes,
+    llm=pcp.llm_extraction,
+    part_tokens=PART_TOKENS,
+    workers=SPLIT_WORKERS,
+):
+    """
+    Extract a PDF and save the output, splitting it when it is too long.
+
+    The PDF's input tokens are measured (or read from the token count cache)
+    first. PDFs above tokenCounter.SPLIT_TOKENS or SPLIT_PAGES are split into
+    page ranges of about part_tokens, which are extracted concurrently and
+    merged into one record in page order. Any request whose output is truncated
+    is split further.
+
+    Args:
+        pdf_path (str): Path of the PDF file.
+        pdf_bytes (bytes): The PDF bytes.
+        llm (callable): Sends a base64-encoded PDF and returns the message.
+            Callers with a concurrency budget of their own, like the pipeline,
+            pass an llm that waits for a slot of that budget.
+        part_tokens (int): The target tokens per page range.
+        workers (int): Page ranges extracted at the same time.
+
+    Returns:
+        dict: The extraction output.
+    """
+    measured = tokenCounter.measure_pdf(pdf_bytes, pcp.client)
+    if not needs_split(measured):
+        parts = extract_range(pdf_bytes, 0, llm)
+    else:
+        reader = PdfReader(BytesIO(pdf_bytes))
+        ranges = page_ranges(measured["pages"], measured["tokens"], part_tokens)
+        print(
+            f"---SPLITTING {pdf_path}: {measured['pages']} pages, "
+            f"{measured['tokens']} tokens into {len(ranges)} parts---"
+        )
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    extract_range, page_range_pdf(reader, start, end), start, llm
+                )
+                for start, end in ranges
+            ]
+            parts = [part for future in futures for part in future.result()]
+
+    return save_parts(pdf_path, parts)
+
+
+def save_parts(pdf_path, parts):
+    """
+    Merge the extracted parts of a PDF and save the output.
+
+    The file name stands in for a name the model left out.
+
+    Args:
+        pdf_path (str): Path of the PDF file.
+        parts (list): (first page, extraction output) of each extracted part.
+
+    Returns:
+        dict: The extraction output.
+    """
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    if len(parts) == 1:
+        output_data = parts[0][1]
+        output_data["name"] = output_data.get("name") or stem
+    else:
+        output_data = merge_outputs(parts, stem)
+    return pcp.write_output(pdf_path, output_data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract PDFs, splitting oversized ones into page ranges."
+    )
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--part-tokens", type=int, default=PART_TOKENS)
+    parser.add_argument("--workers", type=int, default=SPLIT_WORKERS)
+    args = parser.parse_args()
+
+    for pdf_path in args.pdfs:
+        extract_pdf(
+            pdf_path,
+            pcp.read_pdf(pdf_path),
+            part_tokens=args.part_tokens,
+            workers=args.workers,
+        )
@@ -0,0 +1,369 @@
+import argparse
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+import anthropic
+import pdfSplitter
+import promptCachePDF as pcp
+from chunking import add_chunks
+from manifest import Manifest
+
+# Pipeline settings
+LLM_CONCURRENCY = 4
+CONVERT_WORKERS = 1
+UPSERT_BATCH_SIZE = 8
+QUEUE_SIZE = 16
+
+# Backoff settings for rate limited / overloaded Anthropic calls
+MAX_RETRIES = 6
+BASE_DELAY = 2.0
+MAX_DELAY = 60.0
+
+_DONE = object()
+
+
+class RateLimiter:
+    """
+    Shared cool-down so every LLM worker backs off when one of them is rate limited.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pause_until = 0.0
+
+    def wait(self):
+        with self._lock:
+            delay = self._pause_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._pause_until = max(self._pause_until, time.monotonic() + seconds)
+
+
+def _retry_delay(error, attempt):
+    """
+    Delay before the next attempt, honouring the server's retry-after header.
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(MAX_DELAY, float(retry_after))
+            except ValueError:
+                pass
+    return min(MAX_DELAY, BASE_DELAY * 2**attempt) * random.uniform(0.5, 1.0)
+
+
+def with_backoff(func, *args, limiter=None):
+    """
+    Call func, retrying with exponential backoff on rate limits and overloads.
+
+    Args:
+        func (callable): The Anthropic call to make.
+        *args: Arguments passed to func.
+        limiter (RateLimiter): Optional cool-down shared between workers.
+
+    Returns:
+        The return value of func.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter:
+            limiter.wait()
+        try:
+            return func(*args)
+        except (
+            anthropic.RateLimitError,
+            anthropic.InternalServerError,
+            anthropic.APIConnectionError,
+        ) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(e, attempt)
+            if limiter and isinstance(e, anthropic.RateLimitError):
+                limiter.pause(delay)
+            print(f"---BACKOFF: {type(e).__name__}, retrying in {delay:.1f}s---")
+            time.sleep(delay)
+
+
+class Stage:
+    """
+    A pool of worker threads reading items from one queue and writing results to the next.
+
+    Attributes:
+        name: The stage name used in the summary.
+        workers: The number of worker threads.
+        processed: The number of items completed.
+        failed: The number of items that raised an error.
+        busy: The total seconds spent inside the stage function.
+    """
+
+    def __init__(self, name, func, in_queue, out_queue=None, workers=1):
+        self.name = name
+        self.func = func
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.workers = workers
+        self.processed = 0
+        self.failed = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.started = time.monotonic()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"{self.name}-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+        self.finished = time.monotonic()
+        if self.out_queue is not None:
+            self.out_queue.put(_DONE)
+
+    def _run(self):
+        while True:
+            item = self.in_queue.get()
+            if item is _DONE:
+                # Let the sibling workers see the sentinel as well
+                self.in_queue.put(_DONE)
+                return
+
+            start = time.monotonic()
+            try:
+                result = self.func(item)
+            # Any error fails only this item: a worker that died would leave the
+            # queues blocked and the pipeline hanging
+            except Exception as e:  # noqa: BLE001
+                result = None
+                print(f"---{self.name.upper()} FAILED: {e}---")
+                with self._lock:
+                    self.failed += 1
+            else:
+                with self._lock:
+                    self.processed += 1
+            with self._lock:
+                self.busy += time.monotonic() - start
+
+            if result is not None and self.out_queue is not None:
+                self.out_queue.put(result)
+
+    def fail_processed(self, count):
+        """
+        Count items already counted as processed as failed instead, e.g. the
+        buffered items of a batch that could not be written.
+        """
+        with self._lock:
+            self.processed -= count
+            self.failed += count
+
+    def summary(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        rate = self.processed / elapsed if elapsed else 0.0
+        return (
+            f"{self.name:<10} workers={self.workers:<3} done={self.processed:<5} "
+            f"failed={self.failed:<4} busy={self.busy:8.1f}s "
+            f"wall={elapsed:8.1f}s throughput={rate:6.2f} docs/s"
+        )
+
+
+def pipelined_pdf_processing(
+    folder_path,
+    llm_concurrency=LLM_CONCURRENCY,
+    convert_workers=CONVERT_WORKERS,
+    upsert_batch_size=UPSERT_BATCH_SIZE,
+    manifest_path=None,
+):
+    """
+    Process every PDF in a folder through a bounded, multi-stage pipeline.
+
+    Each PDF flows through read/encode -> LLM extraction -> Docling chunking ->
+    embed/upsert, with a bounded queue between stages so that the LLM calls for
+    one document overlap with the conversion and insertion of the others.
+
+    Args:
+        folder_path (str): The folder containing the PDFs.
+        llm_concurrency (int): Maximum number of concurrent Anthropic calls.
+        convert_workers (int): Number of Docling conversion workers, each with its
+            own converter.
+        upsert_batch_size (int): Number of documents embedded per vector store write.
+        manifest_path (str): Optional manifest database. When given, only the
+            stages the manifest has not recorded are run.
+
+    Returns:
+        list: The stages, for inspecting the per-stage counters.
+
+    Raises:
+        Exception: The error of the last upsert, once the summary is printed.
+            The manifest keeps its documents pending for the next run.
+    """
+    limiter = RateLimiter()
+    # Every Anthropic call holds a slot, including the page ranges of a split
+    # PDF, so llm_concurrency caps the calls in flight across all workers
+    llm_slots = threading.BoundedSemaphore(llm_concurrency)
+    manifest = Manifest(manifest_path) if manifest_path else None
+
+    read_queue = queue.Queue()
+    llm_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    convert_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    upsert_queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    # Items are dicts carrying the PDF path, its content hash (manifest runs
+    # only) and the extraction output once known.
+    def read(item):
+        # Read once, for both the Anthropic payload and the Docling conversion
+        item["pdf_bytes"] = pcp.read_pdf(item["path"])
+        return item
+
+    def llm(pdf_data):
+        with llm_slots:
+            return with_backoff(pcp.llm_extraction, pdf_data, limiter=limiter)
+
+    def extract(item):
+        if item["output_data"] is None:
+            # Oversized PDFs are split into page ranges that share the backoff
+            # and the concurrency budget
+            item["output_data"] = pdfSplitter.extract_pdf(
+                item["path"], item["pdf_bytes"], llm=llm, workers=llm_concurrency
+            )
+            if manifest:
+                name = item["output_data"]["name"]
+                manifest.mark_done(
+                    item["hash"],
+                    "extraction",
+                    name=name,
+                    output_path=pcp.output_path_for(name),
+                )
+        return item
+
+    def convert(item):
+        item["chunks"] = pcp.document_chunks(
+            item["path"], item["output_data"], item.pop("pdf_bytes")
+        )
+        return item
+
+    pending = []
+    pending_lock = threading.Lock()
+
+    def flush(final=False):
+        items = pending[:]
+        pending.clear()
+        if items:
+            try:
+                ids = add_chunks(
+                    pcp.vector_db, [chunk for item in items for chunk in item["chunks"]]
+                )
+            except Exception:
+                # The whole batch failed, not only the item that filled it. The
+                # manifest still has every item pending, so a re-run retries them.
+                upsert_stage.fail_processed(len(items) if final else len(items) - 1)
+                raise
+            if manifest:
+                offset = 0
+                for item in items:
+                    count = len(item["chunks"])
+                    manifest.mark_done(
+                        item["hash"], "vector", vector_ids=ids[offset : offset + count]
+                    )
+                    offset += count
+            print(f"Added {len(items)} documents as {len(ids)} chunks")
+
+    def upsert(item):
+        with pending_lock:
+            pending.append(item)
+            if len(pending) >= upsert_batch_size:
+                flush()
+
+    upsert_stage = Stage("upsert", upsert, upsert_queue)
+    stages = [
+        Stage("read", read, read_queue, llm_queue),
+        Stage("llm", extract, llm_queue, convert_queue, workers=llm_concurrency),
+        Stage("convert", convert, convert_queue, upsert_queue, workers=convert_workers),
+        upsert_stage,
+    ]
+
+    if manifest:
+        manifest.sync_folder(folder_path)
+        pcp.remove_tombstones(manifest)
+        for row in manifest.pending("extraction"):
+            read_queue.put(
+                {"path": row["path"], "hash": row["content_hash"], "output_data": None}
+            )
+        # Extracted but not yet indexed, e.g. after a crash: skip the LLM call
+        for row in manifest.pending("vector"):
+            with open(row["output_path"]) as json_file:
+                output_data = json.load(json_file)
+            read_queue.put(
+                {
+                    "path": row["path"],
+                    "hash": row["content_hash"],
+                    "output_data": output_data,
+                }
+            )
+    else:
+        for pdf_file in sorted(os.listdir(folder_path)):
+            read_queue.put(
+                {"path": f"{folder_path}/{pdf_file}", "hash": None, "output_data": None}
+            )
+    read_queue.put(_DONE)
+
+    start = time.monotonic()
+    for stage in stages:
+        stage.start()
+    for stage in stages:
+        stage.join()
+    try:
+        with pending_lock:
+            flush(final=True)
+    finally:
+        # Reported even when the last upsert fails, before its error is raised
+        elapsed = time.monotonic() - start
+        print("---PIPELINE SUMMARY---")
+        for stage in stages:
+            print(stage.summary())
+        print(f"Total wall time: {elapsed:.1f}s")
+        pcp.telemetry.report()
+    print("All PDFs processed.")
+
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pipelined extraction and indexing of circular PDFs."
+    )
+    parser.add_argument(
+        "folder",
+        nargs="?",
+        default="/workspace/legalAgent/anthropicExtractor/circulars",
+    )
+    parser.add_argument("--llm-concurrency", type=int, default=LLM_CONCURRENCY)
+    parser.add_argument("--convert-workers", type=int, default=CONVERT_WORKERS)
+    parser.add_argument("--upsert-batch-size", type=int, default=UPSERT_BATCH_SIZE)
+    parser.add_argument(
+        "--manifest",
+        default=pcp.MANIFEST_PATH,
+        help="Manifest database for incremental runs, pass an empty string to process everything",
+    )
+    args = parser.parse_args()
+
+    pipelined_pdf_processing(
+        args.folder,
+        llm_concurrency=args.llm_concurrency,
+        convert_workers=args.convert_workers,
+        upsert_batch_size=args.upsert_batch_size,
+        manifest_path=args.manifest or None,
+    )
@@ -1,16 +1,23 @@
 import base64
 import json
 import os
-import re
-import string
+import threading
+import time
+from io import BytesIO
 
 import anthropic
+from anthropic.types.beta import BetaMessage
+from cacheTelemetry import telemetry
+from chunking import EMBED_BATCH_SIZE, add_chunks, chunk_document
+from docling.datamodel.base_models import DocumentStream
 from docling.document_converter import DocumentConverter
 from dotenv import load_dotenv
+from extractionRequest import BETAS, extraction_params
 from json_repair import repair_json
 from langchain_chroma import Chroma
-from langchain_core.documents import Document
 from langchain_huggingface import HuggingFaceEmbeddings
+from manifest import Manifest, vector_ids
+from responseCache import ResponseCache
 
 load_dotenv()
 my_api_key = os.getenv("ANTHROPIC_API_KEY")
@@ -20,6 +27,7 @@ client = anthropic.Anthropic()
 embeddings = HuggingFaceEmbeddings(
     model_name="nomic-ai/nomic-embed-text-v1.5",
     model_kwargs={"device": "cuda", "trust_remote_code": True},
+    encode_kwargs={"batch_size": EMBED_BATCH_SIZE},
 )
 
 vector_db = Chroma(
@@ -28,135 +36,301 @@ vector_db = Chroma(
     embedding_function=embeddings,
 )
 
+OUTPUT_FOLDER = "/workspace/legalAgent/anthropicExtractor/output"
+MANIFEST_PATH = "/workspace/legalAgent/anthropicExtractor/manifest.sqlite3"
+RESPONSE_CACHE_PATH = "/workspace/legalAgent/anthropicExtractor/responseCache.sqlite3"
+
+response_cache = ResponseCache(RESPONSE_CACHE_PATH)
+
+# One Docling converter per thread, so its layout models are loaded once per worker
+_converters = threading.local()
+
 
 # PDF Processing
-def pdf_processing(folder_path):
+def pdf_processing(folder_path, manifest_path=None):
+    """
+    Extract and index every PDF in a folder.
+
+    Args:
+        folder_path (str): The folder containing the PDFs.
+        manifest_path (str): Optional manifest database. When given, only new or
+            changed PDFs are processed and removed PDFs are dropped from the
+            output folder and the vector store.
+    """
+    if manifest_path:
+        incremental_pdf_processing(folder_path, Manifest(manifest_path))
+        return
+
     pdf_files = os.listdir(folder_path)
 
     for pdf_file in pdf_files:
-        with open(f"{folder_path}/{pdf_file}", "rb") as pdf_file:
-            pdf_data = base64.standard_b64encode(pdf_file.read()).decode("utf-8")
-            pdf_path = f"{pdf_file.name}"
-            llm_processign(pdf_path, pdf_data)
+        pdf_path = f"{folder_path}/{pdf_file}"
+        pdf_bytes = read_pdf(pdf_path)
+        output_data = extract_pdf(pdf_path, pdf_bytes)
+        add_document(pdf_path, output_data, pdf_bytes)
+
+    telemetry.report()
+    print("All PDFs processed.")
+
 
+def incremental_pdf_processing(folder_path, manifest):
+    """
+    Run only the extraction and vector stages the manifest has not recorded.
+
+    Args:
+        folder_path (str): The folder containing the PDFs.
+        manifest (Manifest): The ingestion manifest.
+    """
+    manifest.sync_folder(folder_path)
+    remove_tombstones(manifest)
+
+    for row in manifest.pending("extraction"):
+        # Read once, for both the Anthropic payload and the Docling conversion
+        pdf_bytes = read_pdf(row["path"])
+        output_data = extract_pdf(row["path"], pdf_bytes)
+        manifest.mark_done(
+            row["content_hash"],
+            "extraction",
+            name=output_data["name"],
+            output_path=output_path_for(output_data["name"]),
+        )
+        index_document(manifest, row, output_data, pdf_bytes)
+
+    # Extracted in an earlier run but not indexed yet
+    for row in manifest.pending("vector"):
+        with open(row["output_path"], "r") as json_file:
+            output_data = json.load(json_file)
+        index_document(manifest, row, output_data, read_pdf(row["path"]))
+
+    telemetry.report()
     print("All PDFs processed.")
 
 
+def index_document(manifest, row, output_data, pdf_bytes):
+    ids = add_document(row["path"], output_data, pdf_bytes)
+    manifest.mark_done(row["content_hash"], "vector", vector_ids=ids)
+
+
+def remove_tombstones(manifest):
+    """
+    Drop removed PDFs from the vector store and the output folder.
+
+    Args:
+        manifest (Manifest): The ingestion manifest.
+    """
+    for row in manifest.tombstones("vector"):
+        ids = vector_ids(row)
+        if ids:
+            vector_db.delete(ids=ids)
+        manifest.clear(row["content_hash"], "vector")
+        print(f"Removed {row['path']} from the vector store")
+    manifest.purge_outputs()
+
+
+def read_pdf(pdf_path):
+    """
+    Read a PDF into memory.
+
+    The same bytes are base64-encoded for the Anthropic document block and
+    converted by Docling, so every file is read from disk once.
+
+    Args:
+        pdf_path (str): Path of the PDF file.
+
+    Returns:
+        bytes: The PDF bytes.
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        return pdf_file.read()
+
+
+def encode_pdf(pdf_bytes):
+    """
+    Base64-encode PDF bytes for the Anthropic document block.
+    """
+    return base64.standard_b64encode(pdf_bytes).decode("utf-8")
+
+
 # LLM Calling
-def llm_processign(pdf_path, pdf_data):
-    message = client.beta.messages.create(
-        model="claude-3-5-sonnet-20241022",
-        betas=["pdfs-2024-09-25", "prompt-caching-2024-07-31"],
-        max_tokens=1024,
-        system=[
-            {
-                "type": "text",
-                "text": """
-                        You are an advanced document analysis AI specializing in extracting structured information from official regulatory documents.
-
-                        Task: Analyze the given document and generate a precise JSON structure with the following specifications:
-
-                        Output Requirements:
-                        - Use strict JSON formatting
-                        - Ensure all extracted information is verbatim from the source document
-                        - Maintain professional, neutral language
-                        - Be comprehensive yet concise
-
-                        Output Structure:
-                        {
-                            "name": "",
-                            "date_of_issue": "",
-                            "summary": "",
-                            "relations": {
-                                "document_name": "relationship_type"
-                            },
-                            "questions": []
-                        }
-
-                        1. Document Identification:
-                        - Capture the exact, full official name of the document which is the unique name at the top of the document excluding the title
-                        - Extract the precise date of issue
-
-                        2. Document Relations Extraction:
-                        - Identify all mentions of other documents within the text
-                        - Extract the full official name of the related document, remove any additional information like dates for example "Circular 123" instead of "Circular 123 dated 2024"
-                        - Determine their relationship of the extracted document to the current document using a single word. Examples: superseded, referenced, amended, invoked, replaced, cited
-
-                        3. Optimized Summary:
-                        - Create a concise yet comprehensive summary
-                        - Ensure the summary is rich in key terms and contextual information
-                        - Capture the core purpose, key regulatory changes, and fundamental implications of the document
-
-                        4. Factual Questions:
-                        - Generate questions that can be answered ONLY from the exact text of the document
-                        - Questions must be:
-                            * Directly answerable from the document's content
-                            * Specific and precise
-                            * Focused on factual details
-
-                        
-                    """,
-                "cache_control": {"type": "ephemeral"},
-            },
-        ],
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "document",
-                        "source": {
-                            "type": "base64",
-                            "media_type": "application/pdf",
-                            "data": pdf_data,
-                        },
-                    },
-                ],
-            }
-        ],
-    )
+def extract_pdf(pdf_path, pdf_bytes):
+    """
+    Extract a PDF and save the output, splitting it into page ranges when it is
+    too long for one request.
+
+    Args:
+        pdf_path (str): Path of the PDF file.
+        pdf_bytes (bytes): The PDF bytes.
+
+    Returns:
+        dict: The extraction output.
+    """
+    # Imported here because pdfSplitter builds on this module
+    import pdfSplitter
+
+    return pdfSplitter.extract_pdf(pdf_path, pdf_bytes)
+
+
+def llm_processign(pdf_path, pdf_bytes):
+    message = llm_extraction(encode_pdf(pdf_bytes))
 
     print(message.content[0].text)
-    output_processing(pdf_path, message)
+    output_processing(pdf_path, message, pdf_bytes)
+
+
+def llm_extraction(pdf_data):
+    """
+    Send one PDF to Claude and return the raw extraction message.
+
+    Responses are cached on disk by request, so re-running the extraction of
+    an unchanged PDF does not call the API again.
+
+    Args:
+        pdf_data (str): The base64-encoded PDF.
+
+    Returns:
+        Message: The Anthropic response holding the extraction JSON.
+    """
+    params = extraction_params(pdf_data)
+    request = json.dumps({"betas": BETAS, **params}, sort_keys=True)
+    cached = response_cache.get(params["model"], request)
+    if cached is not None:
+        print("---RESPONSE CACHE HIT---")
+        return BetaMessage.model_validate_json(cached)
+
+    start = time.perf_counter()
+    message = client.beta.messages.create(betas=BETAS, **params)
+    telemetry.record(message, time.perf_counter() - start)
+    response_cache.put(params["model"], request, message.model_dump_json())
+    return message
 
 
 # JSON Processing and Saving
-def output_processing(pdf_path, message):
-    print(f"PDF Path: {pdf_path}")
-    output_folder = "/workspace/legalAgent/anthropicExtractor/output"
+def output_processing(pdf_path, message, pdf_bytes=None):
+    output_data = save_output(pdf_path, message)
+    add_document(pdf_path, output_data, pdf_bytes)
+
+
+def add_document(pdf_path, output_data, pdf_bytes=None):
+    """
+    Chunk a PDF and add the chunks to the vector store.
 
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+    Returns:
+        list: The ids of the added chunks.
+    """
+    chunks = document_chunks(pdf_path, output_data, pdf_bytes)
+    ids = add_chunks(vector_db, chunks)
+    print(f"Added {len(ids)} chunks of {output_data['name']}")
+    return ids
 
+
+def save_output(pdf_path, message):
+    """
+    Repair the extraction JSON from the LLM and save it to the output folder.
+
+    Args:
+        pdf_path (str): Path of the source PDF.
+        message (Message): The Anthropic response for the PDF.
+
+    Returns:
+        dict: The parsed extraction output.
+    """
+    return write_output(pdf_path, parse_output(message))
+
+
+def parse_output(message):
+    """
+    Parse the extraction JSON of an Anthropic response, repairing it if needed.
+    """
     repaired_json = repair_json(message.content[0].text)
-    output_data = json.loads(repaired_json)
+    return json.loads(repaired_json)
+
 
-    output_filename = f"{output_data['name']}.json"
-    output_path = os.path.join(output_folder, output_filename)
+def write_output(pdf_path, output_data):
+    """
+    Save an extraction output to the output folder.
+
+    Args:
+        pdf_path (str): Path of the source PDF.
+        output_data (dict): The extraction output.
+
+    Returns:
+        dict: The extraction output.
+    """
+    print(f"PDF Path: {pdf_path}")
+
+    if not os.path.exists(OUTPUT_FOLDER):
+        os.makedirs(OUTPUT_FOLDER)
+
+    output_path = output_path_for(output_data["name"])
 
     with open(output_path, "w") as json_file:
         json.dump(output_data, json_file, indent=4)
 
     print(f"Output saved to {output_path}")
+    return output_data
+
+
+def output_path_for(name):
+    """
+    The path of the extraction JSON for a document name.
+    """
+    return os.path.join(OUTPUT_FOLDER, f"{name}.json")
+
+
+def get_converter():
+    """
+    The Docling converter of the current thread, created on first use.
+
+    Docling loads its layout models when a converter first converts a PDF, so
+    reusing the converter keeps them loaded for every later document.
 
-    printable = set(string.printable)
-    converter = DocumentConverter()
-    result = converter.convert(pdf_path)
-    doc = result.document.export_to_markdown()
-    doc = doc.replace("<!-- image -->", "")
-    doc = "".join(filter(lambda x: x in printable, doc))
-    doc = re.sub(r"\n+", "\n", doc)
-    doc = re.sub(r"https?://\S+|www\.\S+", "", doc)
-    doc = Document(
-        page_content=doc,
-        metadata={
+    Returns:
+        DocumentConverter: The thread's converter.
+    """
+    converter = getattr(_converters, "converter", None)
+    if converter is None:
+        converter = DocumentConverter()
+        _converters.converter = converter
+    return converter
+
+
+def document_chunks(pdf_path, output_data, pdf_bytes=None):
+    """
+    Convert a PDF with Docling and split it into chunks for the vector store.
+
+    Args:
+        pdf_path (str): Path of the source PDF.
+        output_data (dict): The extraction output for the PDF.
+        pdf_bytes (bytes): The PDF already read into memory. When None, Docling
+            reads the file from pdf_path.
+
+    Returns:
+        list: The section-aware chunks with name, date and page metadata.
+    """
+    source = pdf_path
+    if pdf_bytes is not None:
+        source = DocumentStream(
+            name=os.path.basename(pdf_path), stream=BytesIO(pdf_bytes)
+        )
+
+    start = time.perf_counter()
+    result = get_converter().convert(source)
+    print(
+        f"---CONVERTED {os.path.basename(pdf_path)} in "
+        f"{time.perf_counter() - start:.2f}s---"
+    )
+    return chunk_document(
+        result.document,
+        {
             "source_path": pdf_path,
             "name": output_data["name"],
             "date_of_issue": output_data["date_of_issue"],
         },
     )
-    ids = vector_db.add_documents(documents=[doc])
-    print(f"Added document with ids: {ids}")
 
 
-pdf_processing("/workspace/legalAgent/anthropicExtractor/circulars")
+if __name__ == "__main__":
+    pdf_processing(
+        "/workspace/legalAgent/anthropicExtractor/circulars",
+        manifest_path=MANIFEST_PATH,
+    )
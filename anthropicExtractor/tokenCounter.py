@@ -1,46 +1,321 @@
+import argparse
 import base64
+import hashlib
 import json
 import os
-from datetime import datetime
+import threading
+from collections import ChainMap
+from io import BytesIO
 
 import anthropic
 from dotenv import load_dotenv
+from extractionRequest import extraction_params
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
 
 load_dotenv()
-my_api_key = os.getenv("ANTHROPIC_API_KEY")
-
-client = anthropic.Anthropic()
-
-with open(
-    "/workspace/legalAgent/anthropicExtractor/circulars/Existing Circular.pdf", "rb"
-) as pdf_file:
-    pdf_base64 = base64.standard_b64encode(pdf_file.read()).decode("utf-8")
-
-response = client.beta.messages.count_tokens(
-    betas=["token-counting-2024-11-01", "pdfs-2024-09-25"],
-    model="claude-3-5-sonnet-20241022",
-    messages=[
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "document",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "application/pdf",
-                        "data": pdf_base64,
-                    },
-                },
-                {"type": "text", "text": "Please summarize this document."},
-            ],
-        }
-    ],
-)
-
-timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-output_filename = f"response_{timestamp}.json"
-
-with open(output_filename, "w") as json_file:
-    json.dump(response.json(), json_file, indent=4)
-
-print(response.json())
+
+# Betas for counting the tokens of PDF requests
+COUNT_BETAS = ["token-counting-2024-11-01", "pdfs-2024-09-25"]
+# Local approximation when the API is not used: the page text at about four
+# characters per token, plus the image the API renders of every page
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS_PER_PAGE = 1600
+# USD per million tokens for Claude 3.5 Sonnet, cache writes cost 1.25x and
+# cache reads 0.1x the input price
+INPUT_PRICE = 3.00
+CACHE_WRITE_PRICE = 3.75
+CACHE_READ_PRICE = 0.30
+OUTPUT_PRICE = 15.00
+# Shortest prompt prefix the API will cache for Sonnet models
+MIN_CACHEABLE_TOKENS = 1024
+# Documents above either limit should be split before they are sent
+SPLIT_TOKENS = 100000
+SPLIT_PAGES = 100
+# Input tokens per minute allowed by the account's rate limit
+INPUT_TOKENS_PER_MINUTE = 40000
+
+CACHE_PATH = "/workspace/legalAgent/anthropicExtractor/tokenCounts.json"
+
+_cache_lock = threading.Lock()
+# Token count caches loaded by measure_pdf, by path
+_caches = {}
+
+
+def load_cache(cache_path):
+    if os.path.exists(cache_path):
+        with open(cache_path) as cache_file:
+            return json.load(cache_file)
+    return {}
+
+
+def save_cache(cache, cache_path):
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as cache_file:
+        json.dump(cache, cache_file, indent=4)
+    os.replace(tmp_path, cache_path)
+
+
+def local_estimate(pdf_bytes):
+    """
+    Approximate the input tokens of a PDF from its page count and text.
+
+    Args:
+        pdf_bytes (bytes): The PDF.
+
+    Returns:
+        tuple: The page count and the estimated tokens.
+    """
+    reader = PdfReader(BytesIO(pdf_bytes))
+    chars = sum(len(page.extract_text() or "") for page in reader.pages)
+    pages = len(reader.pages)
+    return pages, chars // CHARS_PER_TOKEN + pages * IMAGE_TOKENS_PER_PAGE
+
+
+def api_count(client, params):
+    """
+    Count the input tokens of an extraction request with the API.
+    """
+    params = {key: value for key, value in params.items() if key != "max_tokens"}
+    return client.beta.messages.count_tokens(betas=COUNT_BETAS, **params).input_tokens
+
+
+def system_tokens(client, cache):
+    """
+    The input tokens of the cached system block.
+
+    Args:
+        client (Anthropic): The client, or None to approximate locally.
+        cache (dict): The token count cache.
+
+    Returns:
+        int: The system block tokens.
+    """
+    params = extraction_params("")
+    text = "".join(block["text"] for block in params["system"])
+    key = "system:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+    if key in cache and (cache[key]["method"] == "api" or client is None):
+        return cache[key]["tokens"]
+
+    if client is not None:
+        # The API needs a message, a single character is close enough to nothing
+        params["messages"] = [{"role": "user", "content": "."}]
+        tokens = api_count(client, params)
+        cache[key] = {"tokens": tokens, "method": "api"}
+    else:
+        tokens = len(text) // CHARS_PER_TOKEN
+        cache[key] = {"tokens": tokens, "method": "estimate"}
+    return tokens
+
+
+def count_document(pdf_bytes, system, cache, client=None):
+    """
+    Count the input tokens of one PDF, reusing the cached count if there is one.
+
+    API counts are always reused, local estimates only while the API is not
+    used.
+
+    Args:
+        pdf_bytes (bytes): The PDF.
+        system (int): The system block tokens, subtracted from API counts.
+        cache (dict): The token count cache, updated in place.
+        client (Anthropic): The client for API counts, or None to approximate
+            locally.
+
+    Returns:
+        dict: The pages, tokens (without the system block) and method.
+    """
+    content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+    entry = cache.get(content_hash)
+    if entry is not None and (entry["method"] == "api" or client is None):
+        return entry
+
+    pages, tokens = local_estimate(pdf_bytes)
+    entry = {"pages": pages, "tokens": tokens, "method": "estimate"}
+    if client is not None:
+        pdf_data = base64.standard_b64encode(pdf_bytes).decode("utf-8")
+        tokens = api_count(client, extraction_params(pdf_data)) - system
+        entry.update(tokens=tokens, method="api")
+    cache[content_hash] = entry
+    return entry
+
+
+def measure_pdf(pdf_bytes, client=None, cache_path=CACHE_PATH):
+    """
+    Count the input tokens of one PDF through the shared cache file.
+
+    Falls back to the local approximation if the API call fails. Safe to call
+    from several threads: the cache file is read once per process, and the
+    lock is only held to look up and store counts, not during API calls.
+
+    Returns:
+        dict: The pages, tokens (without the system block) and method.
+    """
+    with _cache_lock:
+        if cache_path not in _caches:
+            _caches[cache_path] = load_cache(cache_path)
+        cache = _caches[cache_path]
+    # New counts go to updates, lookups fall through to the shared cache
+    updates = {}
+    view = ChainMap(updates, cache)
+    try:
+        system = system_tokens(client, view)
+        entry = count_document(pdf_bytes, system, view, client)
+    except (anthropic.APIError, anthropic.APIConnectionError) as e:
+        print(f"---TOKEN COUNTING API UNAVAILABLE, ESTIMATING LOCALLY: {e}---")
+        system = system_tokens(None, view)
+        entry = count_document(pdf_bytes, system, view)
+    if updates:
+        with _cache_lock:
+            cache.update(updates)
+            save_cache(cache, cache_path)
+    return entry
+
+
+def count_corpus(folder_path, client=None, cache_path=CACHE_PATH):
+    """
+    Count the input tokens of every PDF in a folder.
+
+    Args:
+        folder_path (str): The folder containing the PDFs.
+        client (Anthropic): The client for API counts, or None to approximate
+            locally. The API is dropped for the rest of the run if a call fails.
+        cache_path (str): The token count cache.
+
+    Returns:
+        tuple: The system block tokens, and a list of per-document dicts with
+            path, pages, tokens (without the system block) and method.
+    """
+    cache = load_cache(cache_path)
+    try:
+        system = system_tokens(client, cache)
+    except (anthropic.APIError, anthropic.APIConnectionError) as e:
+        print(f"---TOKEN COUNTING API UNAVAILABLE, ESTIMATING LOCALLY: {e}---")
+        client = None
+        system = system_tokens(client, cache)
+
+    documents = []
+    for pdf_file in sorted(os.listdir(folder_path)):
+        if not pdf_file.lower().endswith(".pdf"):
+            continue
+        path = os.path.join(folder_path, pdf_file)
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        try:
+            entry = count_document(pdf_bytes, system, cache, client)
+        except (anthropic.APIError, anthropic.APIConnectionError) as e:
+            print(f"---TOKEN COUNTING API UNAVAILABLE, ESTIMATING LOCALLY: {e}---")
+            client = None
+            entry = count_document(pdf_bytes, system, cache)
+        # Corrupt or encrypted PDFs are skipped, the report covers the others
+        except (PyPdfError, ValueError) as e:
+            print(f"---COULD NOT READ {path}: {e}---")
+            continue
+        save_cache(cache, cache_path)
+        documents.append({"path": path, **entry})
+    return system, documents
+
+
+def corpus_report(system, documents, input_tokens_per_minute=INPUT_TOKENS_PER_MINUTE):
+    """
+    Estimate the cost and duration of extracting every document once.
+
+    Every request repeats the system block. With prompt caching the first
+    request writes it to the cache and the others read it, as long as the
+    requests are sent within the cache lifetime. Blocks shorter than
+    MIN_CACHEABLE_TOKENS are not cached.
+
+    Args:
+        system (int): The system block tokens.
+        documents (list): The per-document counts from count_corpus.
+        input_tokens_per_minute (int): The input token rate limit.
+
+    Returns:
+        dict: Token totals, the documents to split, the cost with and without
+            prompt caching, the caching savings and the minutes at the rate limit.
+    """
+    n = len(documents)
+    document_tokens = sum(document["tokens"] for document in documents)
+    input_tokens = document_tokens + n * system
+    output_tokens = n * extraction_params("")["max_tokens"]
+
+    uncached = (input_tokens * INPUT_PRICE + output_tokens * OUTPUT_PRICE) / 1e6
+    cacheable = n > 0 and system >= MIN_CACHEABLE_TOKENS
+    if cacheable:
+        cached = (
+            document_tokens * INPUT_PRICE
+            + system * CACHE_WRITE_PRICE
+            + (n - 1) * system * CACHE_READ_PRICE
+            + output_tokens * OUTPUT_PRICE
+        ) / 1e6
+    else:
+        cached = uncached
+
+    return {
+        "documents": n,
+        "system_tokens": system,
+        "input_tokens": input_tokens,
+        "max_output_tokens": output_tokens,
+        "split": [
+            document["path"]
+            for document in documents
+            if document["tokens"] > SPLIT_TOKENS or document["pages"] > SPLIT_PAGES
+        ],
+        "cacheable": cacheable,
+        "cost": uncached,
+        "cached_cost": cached,
+        "savings": uncached - cached,
+        "minutes": input_tokens / input_tokens_per_minute,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Estimate the tokens and cost of extracting a folder of PDFs."
+    )
+    parser.add_argument(
+        "folder",
+        nargs="?",
+        default="/workspace/legalAgent/anthropicExtractor/circulars",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Approximate locally instead of calling the token counting API",
+    )
+    parser.add_argument("--cache", default=CACHE_PATH)
+    parser.add_argument("--input-tpm", type=int, default=INPUT_TOKENS_PER_MINUTE)
+    args = parser.parse_args()
+
+    client = None
+    if not args.offline and os.getenv("ANTHROPIC_API_KEY"):
+        client = anthropic.Anthropic()
+
+    system, documents = count_corpus(args.folder, client, args.cache)
+    report = corpus_report(system, documents, args.input_tpm)
+
+    print("---TOKEN REPORT---")
+    for document in documents:
+        flag = " SPLIT" if document["path"] in report["split"] else ""
+        print(
+            f"{document['tokens']:>9} tokens {document['pages']:>4} pages "
+            f"{document['method']:<8} {os.path.basename(document['path'])}{flag}"
+        )
+    print(f"{report['documents']} documents")
+    print(f"System block: {report['system_tokens']} tokens per request")
+    print(f"Input tokens: {report['input_tokens']}")
+    print(f"Output tokens: at most {report['max_output_tokens']}")
+    print(f"Cost without prompt caching: ${report['cost']:.2f}")
+    if report["cacheable"]:
+        print(f"Cost with prompt caching: ${report['cached_cost']:.2f}")
+        print(f"Prompt caching saves: ${report['savings']:.2f}")
+    else:
+        print(
+            f"Prompt caching saves nothing: the system block is below "
+            f"{MIN_CACHEABLE_TOKENS} tokens and is not cached"
+        )
+    print(
+        f"Backfill time at {args.input_tpm} input tokens/min: "
+        f"{report['minutes']:.1f} minutes"
+    )
+    print(f"Documents to split before sending: {len(report['split'])}")
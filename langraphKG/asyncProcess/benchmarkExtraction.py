@@ -0,0 +1,165 @@
+import argparse
+import os
+import re
+import tempfile
+import time
+
+import relationsExtractor as rx
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class TokenCounter(BaseCallbackHandler):
+    """
+    Count LLM calls and prompt / completion tokens reported by Ollama.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                self.calls += 1
+                info = generation.generation_info or {}
+                self.prompt_tokens += info.get("prompt_eval_count") or 0
+                self.completion_tokens += info.get("eval_count") or 0
+
+
+def normalize(text):
+    return re.sub(r"[^a-z0-9]+", " ", str(text).lower()).strip()
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def agreement(reference, candidate):
+    """
+    Compare the fields of two extractions of the same document.
+
+    Args:
+        reference (dict): The multi-call extraction.
+        candidate (dict): The one-shot extraction.
+
+    Returns:
+        dict: Exact name and date matches, the Jaccard overlap of the related
+            document names and of the summary words.
+    """
+    return {
+        "name": float(normalize(reference["name"]) == normalize(candidate["name"])),
+        "date_of_issue": float(
+            normalize(reference["date_of_issue"])
+            == normalize(candidate["date_of_issue"])
+        ),
+        "relations": jaccard(
+            map(normalize, reference["relations"] or {}),
+            map(normalize, candidate["relations"] or {}),
+        ),
+        "summary": jaccard(
+            normalize(reference["summary"]).split(),
+            normalize(candidate["summary"]).split(),
+        ),
+    }
+
+
+def benchmark(directory_path, modes=rx.MODES):
+    """
+    Extract every PDF in a directory in each mode and compare the results.
+
+    Pages are parsed before timing, so both modes read them from the cache.
+    Outputs go to a temporary directory instead of the output folder.
+
+    Args:
+        directory_path (str): The directory containing the PDFs.
+        modes (tuple): The modes to run. The first is the reference for the
+            field agreement.
+
+    Returns:
+        dict: Calls, tokens and wall time per mode, and the mean agreement of
+            each later mode with the first.
+    """
+    paths = [
+        os.path.join(directory_path, filename)
+        for filename in sorted(os.listdir(directory_path))
+        if filename.lower().endswith(".pdf")
+    ]
+    for path in paths:
+        rx.cached_pages(path)
+
+    totals = {
+        mode: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+        for mode in modes
+    }
+    agreements = {mode: [] for mode in modes[1:]}
+
+    output_dir = rx.OUTPUT_DIR
+    try:
+        with tempfile.TemporaryDirectory() as rx.OUTPUT_DIR:
+            for path in paths:
+                states = {}
+                for mode in modes:
+                    counter = TokenCounter()
+                    start = time.perf_counter()
+                    states[mode] = rx.extract_document(
+                        path, mode=mode, config={"callbacks": [counter]}
+                    )
+                    totals[mode]["seconds"] += time.perf_counter() - start
+                    totals[mode]["calls"] += counter.calls
+                    totals[mode]["prompt_tokens"] += counter.prompt_tokens
+                    totals[mode]["completion_tokens"] += counter.completion_tokens
+                for mode in modes[1:]:
+                    agreements[mode].append(agreement(states[modes[0]], states[mode]))
+    finally:
+        rx.OUTPUT_DIR = output_dir
+
+    return {
+        "documents": len(paths),
+        "modes": totals,
+        "agreement": {
+            mode: {
+                field: sum(a[field] for a in values) / len(values)
+                for field in values[0]
+            }
+            for mode, values in agreements.items()
+            if values
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare one-shot against multi-call extraction."
+    )
+    parser.add_argument("--directory", default="../data/circulars2")
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Answer repeated LLM calls from the response cache instead of timing them",
+    )
+    args = parser.parse_args()
+
+    # Off by default, a re-run would otherwise time SQLite hits
+    if rx.response_cache is not None:
+        rx.response_cache.enabled = args.cache
+
+    report = benchmark(args.directory)
+
+    print("---EXTRACTION BENCHMARK---")
+    print(f"{report['documents']} documents")
+    for mode, totals in report["modes"].items():
+        print(
+            f"{mode:<9} calls={totals['calls']:<5} "
+            f"prompt_tokens={totals['prompt_tokens']:<8} "
+            f"completion_tokens={totals['completion_tokens']:<7} "
+            f"wall={totals['seconds']:.1f}s"
+        )
+    for mode, fields in report["agreement"].items():
+        print(
+            f"{mode} agreement with {rx.MODES[0]}: "
+            + ", ".join(f"{field}={value:.1%}" for field, value in fields.items())
+        )
+    if args.cache and rx.response_cache is not None:
+        print(f"Response cache: {rx.response_cache.stats()}")
@@ -0,0 +1,113 @@
+import argparse
+import os
+import time
+
+import neo4jKG
+from paths import OUTPUT_DIR
+from py2neo import Graph, NodeMatcher
+
+# Scratch Neo4j database the benchmark may wipe, never the production graph
+BENCHMARK_URI = os.getenv("NEO4J_BENCHMARK_URI")
+
+
+def scale_documents(json_directory, scale):
+    """
+    Replicate the sample extraction outputs into a larger synthetic corpus.
+
+    Every copy suffixes the document and related-document names, so the scaled
+    graph has the same shape as the sample, repeated scale times.
+
+    Args:
+        json_directory (str): The directory with the sample JSON files.
+        scale (int): The number of copies to make.
+
+    Returns:
+        list: The scaled extraction outputs.
+    """
+    samples = neo4jKG.read_documents(json_directory)
+    documents = []
+    for i in range(scale):
+        for data in samples:
+            documents.append(
+                {
+                    "name": f"{data['name']} #{i}",
+                    "date_of_issue": data["date_of_issue"],
+                    "summary": data["summary"],
+                    "questions": data.get("questions", []),
+                    "relations": {
+                        f"{related_doc} #{i}": relation_type
+                        for related_doc, relation_type in data["relations"].items()
+                    },
+                }
+            )
+    return documents
+
+
+def timed_load(graph, documents, bulk, batch_size):
+    """
+    Time one loader on an empty graph.
+
+    The graph is emptied before the timer starts, so both loaders are timed on
+    the same work and the delete is not counted.
+
+    Args:
+        graph (Graph): The scratch Neo4j graph.
+        documents (list): The extraction outputs to load.
+        bulk (bool): Time bulk_load instead of the per-relation merge.
+        batch_size (int): Number of rows per transaction for the bulk loader.
+
+    Returns:
+        float: The load time in seconds.
+    """
+    graph.delete_all()
+    graph.run(
+        "CREATE CONSTRAINT IF NOT EXISTS FOR (d:GovernmentDocument) REQUIRE d.name IS UNIQUE"
+    )
+
+    start = time.perf_counter()
+    if bulk:
+        neo4jKG.bulk_load(graph, documents, batch_size)
+    else:
+        matcher = NodeMatcher(graph)
+        for data in documents:
+            neo4jKG.merge_document(graph, matcher, data)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the per-relation and the batched UNWIND graph loaders."
+    )
+    parser.add_argument("--json-directory", default=OUTPUT_DIR)
+    parser.add_argument("--scale", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=neo4jKG.BATCH_SIZE)
+    parser.add_argument(
+        "--uri",
+        default=BENCHMARK_URI,
+        help="Scratch Neo4j database, wiped by every run (NEO4J_BENCHMARK_URI)",
+    )
+    args = parser.parse_args()
+    if not args.uri or args.uri == neo4jKG.URI:
+        parser.error("pass --uri or set NEO4J_BENCHMARK_URI to a scratch database")
+
+    documents = scale_documents(args.json_directory, args.scale)
+    node_count = len(
+        {d["name"] for d in documents}
+        | {name for d in documents for name in d["relations"]}
+    )
+    edge_count = sum(len(d["relations"]) for d in documents)
+
+    graph = Graph(args.uri, auth=(neo4jKG.USER, neo4jKG.PASSWORD))
+    results = {
+        "per-relation": timed_load(graph, documents, False, args.batch_size),
+        "bulk": timed_load(graph, documents, True, args.batch_size),
+    }
+
+    print("---LOADER BENCHMARK---")
+    print(f"{len(documents)} documents, {node_count} nodes, {edge_count} edges")
+    for loader, seconds in results.items():
+        print(
+            f"{loader:<13} {seconds:8.2f}s "
+            f"{node_count / seconds:10.1f} nodes/s {edge_count / seconds:10.1f} edges/s"
+        )
+    print(f"Speed-up: {results['per-relation'] / results['bulk']:.1f}x")
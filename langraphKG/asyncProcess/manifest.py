@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Stages recorded for every PDF, in processing order
+STAGES = ("extraction", "vector", "graph")
+
+
+def file_hash(path):
+    """
+    Compute the SHA-256 of a file's content.
+
+    Args:
+        path (str): Path of the file.
+
+    Returns:
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Persistent record of which ingestion stages have completed for each PDF.
+
+    Rows are keyed by the PDF's content hash, so renamed or moved files are not
+    re-processed and edited files are treated as new documents. Files that
+    disappear from the folder are tombstoned: their row is kept, flagged as
+    removed, until every completed stage has been cleaned up.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    content_hash TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    name TEXT,
+                    output_path TEXT,
+                    vector_ids TEXT,
+                    extraction_done INTEGER NOT NULL DEFAULT 0,
+                    vector_done INTEGER NOT NULL DEFAULT 0,
+                    graph_done INTEGER NOT NULL DEFAULT 0,
+                    removed INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT
+                )
+                """)
+
+    def sync_folder(self, folder_path):
+        """
+        Register the PDFs currently in a folder and tombstone the ones that are gone.
+
+        Args:
+            folder_path (str): The folder containing the PDFs.
+
+        Returns:
+            dict: The content hash of every file in the folder, keyed by path.
+        """
+        current = {}
+        for filename in sorted(os.listdir(folder_path)):
+            path = os.path.join(folder_path, filename)
+            if os.path.isfile(path):
+                current[path] = file_hash(path)
+
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            for path, content_hash in current.items():
+                self._conn.execute(
+                    """
+                    INSERT INTO documents (content_hash, path, updated_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(content_hash) DO UPDATE
+                    SET path = excluded.path, removed = 0, updated_at = excluded.updated_at
+                    """,
+                    (content_hash, path, now),
+                )
+            hashes = set(current.values())
+            for row in self._conn.execute(
+                "SELECT content_hash, path FROM documents WHERE removed = 0"
+            ).fetchall():
+                if row["content_hash"] not in hashes:
+                    print(f"---TOMBSTONED: {row['path']}---")
+                    self._conn.execute(
+                        "UPDATE documents SET removed = 1, updated_at = ? WHERE content_hash = ?",
+                        (now, row["content_hash"]),
+                    )
+        return current
+
+    def pending(self, stage):
+        """
+        Live documents that still need a stage.
+
+        Every stage after extraction also requires the extraction to be done.
+
+        Args:
+            stage (str): One of STAGES.
+
+        Returns:
+            list: The manifest rows to process.
+        """
+        column = _column(stage)
+        query = f"SELECT * FROM documents WHERE removed = 0 AND {column} = 0"
+        if stage != "extraction":
+            query += " AND extraction_done = 1"
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY path").fetchall()
+
+    def tombstones(self, stage):
+        """
+        Removed documents whose stage output still has to be cleaned up.
+
+        Args:
+            stage (str): One of STAGES.
+
+        Returns:
+            list: The manifest rows to clean up.
+        """
+        column = _column(stage)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT * FROM documents WHERE removed = 1 AND {column} = 1"
+            ).fetchall()
+
+    def has_live_name(self, name):
+        """
+        Whether a live document has this name, e.g. an edited circular that kept
+        the name of its tombstoned version.
+
+        Args:
+            name (str): The extracted document name.
+
+        Returns:
+            bool: True if a document that is not removed has the name.
+        """
+        with self._lock:
+            return (
+                self._conn.execute(
+                    "SELECT 1 FROM documents WHERE removed = 0 AND name = ?", (name,)
+                ).fetchone()
+                is not None
+            )
+
+    def mark_done(
+        self, content_hash, stage, name=None, output_path=None, vector_ids=None
+    ):
+        """
+        Record that a stage finished for a document.
+
+        Args:
+            content_hash (str): The document's content hash.
+            stage (str): One of STAGES.
+            name (str): The extracted document name, if known.
+            output_path (str): The extraction JSON path, if known.
+            vector_ids (list): The vector store ids of the document, if known.
+        """
+        column = _column(stage)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"""
+                UPDATE documents
+                SET {column} = 1,
+                    name = COALESCE(?, name),
+                    output_path = COALESCE(?, output_path),
+                    vector_ids = COALESCE(?, vector_ids),
+                    updated_at = ?
+                WHERE content_hash = ?
+                """,
+                (
+                    name,
+                    output_path,
+                    json.dumps(vector_ids) if vector_ids is not None else None,
+                    datetime.now().isoformat(),
+                    content_hash,
+                ),
+            )
+
+    def clear(self, content_hash, stage):
+        """
+        Record that a tombstoned document's stage output has been removed.
+
+        The row is deleted once nothing is left to clean up.
+
+        Args:
+            content_hash (str): The document's content hash.
+            stage (str): One of STAGES.
+        """
+        column = _column(stage)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE documents SET {column} = 0 WHERE content_hash = ?",
+                (content_hash,),
+            )
+            self._conn.execute(
+                """
+                DELETE FROM documents
+                WHERE content_hash = ? AND removed = 1
+                AND extraction_done = 0 AND vector_done = 0 AND graph_done = 0
+                """,
+                (content_hash,),
+            )
+
+    def purge_outputs(self):
+        """
+        Delete the extraction JSON of tombstoned documents.
+
+        A file is kept when a live document still writes to the same path, which
+        happens when an edited circular keeps its name.
+        """
+        for row in self.tombstones("extraction"):
+            output_path = row["output_path"]
+            with self._lock:
+                shared = self._conn.execute(
+                    "SELECT 1 FROM documents WHERE removed = 0 AND output_path = ?",
+                    (output_path,),
+                ).fetchone()
+            if output_path and not shared and os.path.exists(output_path):
+                os.remove(output_path)
+                print(f"Removed {output_path}")
+            self.clear(row["content_hash"], "extraction")
+
+
+def vector_ids(row):
+    """
+    The vector store ids recorded for a manifest row.
+    """
+    return json.loads(row["vector_ids"]) if row["vector_ids"] else []
+
+
+def _column(stage):
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage {stage!r}, expected one of {STAGES}")
+    return f"{stage}_done"
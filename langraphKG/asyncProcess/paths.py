@@ -0,0 +1,9 @@
+import os
+
+# Locations shared by the extractor, the extraction runner and the graph loader,
+# so the graph load sees the manifest rows and outputs the extraction recorded
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Ingestion manifest of the LangGraph pipeline
+MANIFEST_PATH = os.path.join(BASE_DIR, "manifest.sqlite3")
+# Extraction outputs, one JSON per document
+OUTPUT_DIR = os.path.join(os.path.dirname(BASE_DIR), "output")
@@ -0,0 +1,691 @@
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+from json_repair import repair_json
+from langchain.prompts import PromptTemplate
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_ollama import ChatOllama
+from langgraph.graph import END, START, StateGraph
+from manifest import Manifest, file_hash
+from paths import MANIFEST_PATH, OUTPUT_DIR
+from responseCache import ResponseCache
+from typing_extensions import TypedDict
+
+load_dotenv()
+ollama_base_url = ""
+
+if os.getenv("BASE_URL"):
+    ollama_base_url = os.getenv("BASE_URL")
+else:
+    ollama_base_url = None
+
+relations_extractor_llm = "llama3.1"
+relations_json_formatter_llm = "llama3.1"
+summary_llm = "llama3.1"
+summary_json_formatter_llm = "llama3.1"
+name_date_llm = "llama3.1"
+name_date_json_formatter_llm = "llama3.1"
+one_shot_llm = "llama3.1"
+
+# "multi" makes separate name/date, per-page relation and per-page summary
+# calls, "one_shot" asks for every field in a single call per document
+EXTRACTION_MODE = "multi"
+MODES = ("multi", "one_shot")
+# Context window requested from Ollama for one-shot calls, and the part of it
+# kept free for the answer. Longer documents are split into page windows.
+ONE_SHOT_NUM_CTX = 16000
+ONE_SHOT_OUTPUT_TOKENS = 2048
+
+# Pages sent to the LLM at the same time by the per-page map steps. Ollama only
+# serves them in parallel up to its OLLAMA_NUM_PARALLEL setting.
+PAGE_CONCURRENCY = 4
+
+# Parsed pages are cached here, keyed by the hash of the PDF
+PAGE_CACHE_DIR = "./pageCache"
+# Persistent cache of LLM responses, so re-runs only recompute changed calls.
+# It lives next to this script and is created on first use. None disables it.
+RESPONSE_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "responseCache.sqlite3"
+)
+
+_checkpoint_lock = threading.Lock()
+
+response_cache = ResponseCache(RESPONSE_CACHE_PATH) if RESPONSE_CACHE_PATH else None
+
+# Relationship Extractor
+llm = ChatOllama(
+    base_url=ollama_base_url,
+    model=relations_extractor_llm,
+    format="json",
+    temperature=0,
+    cache=response_cache,
+)
+
+prompt = PromptTemplate(
+    template="""
+     You are an expert in analyzing financial circulars and extracting key information. Your task is to carefully read the given PDF content from a circular and extract specific details in a structured JSON format. Start extracting relationships after the Title of the document.
+
+    Relationships in the context is defined as mention of a particular document, circular, notification, laws, acts. in the current document. Extract the most meaningful single word relationship mentioned in the document. While mentioning the document, please only include the title of the document, date and other identifiers are not required. 
+    
+    Example of relationships include but are not limited to: superseded, amended, overturned, replaced, etc.
+
+    <JSON Output Structure>
+    "relations": {{
+      "Document 1": "Relationship with current document",
+      "Document 2": "Relationship with current document"
+    }}
+    </JSON Structure>
+
+    <PDF Page Content>
+    {pdf_content}
+    </PDF Page Content>
+    """,
+    input_variables=["pdf_content"],
+)
+
+page_relations_extractor_chain = prompt | llm | JsonOutputParser()
+
+llm = ChatOllama(
+    base_url=ollama_base_url,
+    model=relations_json_formatter_llm,
+    format="json",
+    temperature=0,
+    cache=response_cache,
+)
+
+prompt = PromptTemplate(
+    template="""
+    Given the Required Output JSON schema, you are required to format by combining individual string output into a single structured JSON format. Remove or Merge any duplicate or redundant information.
+
+    <Unformatted Input>
+    {unformatted_input}
+    </Unformatted Input>
+
+    <Formatted JSON Output Schema>
+    "relations": {{
+      "Document 1": "Relationship with current document",
+      "Document 2": "Relationship with current document"
+    }}
+    </Formatted JSON Output Schema>
+
+    """,
+    input_variables=["pdf_content"],
+)
+
+relations_json_formatter_chain = prompt | llm | JsonOutputParser()
+
+# Summary Generator
+llm = ChatOllama(
+    base_url=ollama_base_url,
+    model=summary_llm,
+    format="json",
+    temperature=0,
+    cache=response_cache,
+)
+
+prompt = PromptTemplate(
+    template="""
+    You are an expert in analyzing financial circulars and extracting key information. Your task is to carefully read the given PDF content from a circular and extract specific details in a structured JSON format. 
+
+    Summarize the content of the document. The summary should be concise and capture the essence of the document.
+    
+
+    <JSON Output Structure>
+    "summary": "summary of the document"
+    </JSON Structure>
+
+    <PDF Page Content>
+    {pdf_content}
+    </PDF Page Content>
+    """,
+    input_variables=["pdf_content"],
+)
+
+summary_chain = prompt | llm | JsonOutputParser()
+
+llm = ChatOllama(
+    base_url=ollama_base_url,
+    model=summary_json_formatter_llm,
+    format="json",
+    temperature=0,
+    cache=response_cache,
+)
+
+prompt = PromptTemplate(
+    template="""
+    Given the Required Output JSON schema, you are required to format by using the page wise summary to generate a single complete summary for the document and format it in JSON format. Remove or Merge any duplicate or redundant information.
+
+    <Unformatted Input>
+    {unformatted_input}
+    </Unformatted Input>
+
+    <Formatted JSON Output Schema>
+    "summary": "summary of the document"
+    </Formatted JSON Output Schema>
+    """,
+    input_variables=["pdf_content"],
+)
+
+summary_json_formatter_chain = prompt | llm | JsonOutputParser()
+
+# Name and Date Extractor
+llm = ChatOllama(
+    base_url=ollama_base_url,
+    model=name_date_llm,
+    format="json",
+    temperature=0,
+    cache=response_cache,
+)
+
+prompt = PromptTemplate(
+    template="""
+    You are an expert in analyzing financial circulars and extracting key information. Your task is to carefully read the given PDF content from a circular and extract specific details in a structured JSON format. 
+
+    1. Name: Provide the name of the document mentioned at the very start not including RBI/Year/No
+    2. Date of Issue: Find and extract the date when the circular was issued.
+    
+    <JSON Output Structure>
+    "name": "The full name of the document without '/'",
+    "date_of_issue": "The date when the circular was issued in DD/MM/YYYY format",
+    </JSON Structure>
+
+    <PDF Page Content>
+    {pdf_content}
+    </PDF Page Content>
+    """,
+    input_variables=["pdf_content"],
+)
+
+name_date_chain = prompt | llm | JsonOutputParser()
+
+# One-Shot Extractor
+llm = ChatOllama(
+    base_url=ollama_base_url,
+    model=one_shot_llm,
+    format="json",
+    temperature=0,
+    cache=response_cache,
+    num_ctx=ONE_SHOT_NUM_CTX,
+)
+
+prompt = PromptTemplate(
+    template="""
+    You are an expert in analyzing financial circulars and extracting key information. Your task is to carefully read the given PDF content from a circular and extract specific details in a structured JSON format.
+
+    1. Name: Provide the name of the document mentioned at the very start not including RBI/Year/No
+    2. Date of Issue: Find and extract the date when the circular was issued.
+    3. Relationships: Relationships are mentions of a particular document, circular, notification, laws, acts. in the current document. Extract the most meaningful single word relationship for each, for example superseded, amended, overturned, replaced. Only include the title of the related document, date and other identifiers are not required.
+    4. Summary: Summarize the content of the document. The summary should be concise and capture the essence of the document.
+    5. Questions: Generate factual questions that can be answered only from the text of the document.
+
+    <JSON Output Structure>
+    "name": "The full name of the document without '/'",
+    "date_of_issue": "The date when the circular was issued in DD/MM/YYYY format",
+    "relations": {{
+      "Document 1": "Relationship with current document",
+      "Document 2": "Relationship with current document"
+    }},
+    "summary": "summary of the document",
+    "questions": ["Question 1", "Question 2"]
+    </JSON Structure>
+
+    <PDF Content>
+    {pdf_content}
+    </PDF Content>
+    """,
+    input_variables=["pdf_content"],
+)
+
+one_shot_chain = prompt | llm | JsonOutputParser()
+
+
+class GraphState(TypedDict):
+    """
+    Represents the state of our graph.
+
+    Attributes:
+        path: The document path.
+        pages: The text of each page of the document, parsed once.
+        name: The name of the document.
+        date_of_issue: The date when the circular was issued.
+        summary: The summary of the document.
+        relations: The relationships between the current document and other documents.
+        questions: Factual questions about the document, in one-shot mode only.
+        checkpoint_path: Optional file that every extraction node saves its result to.
+
+    Fields that have not been extracted yet are None.
+    """
+
+    path: str
+    pages: list[str]
+    name: str
+    date_of_issue: str
+    summary: str
+    relations: list[str]
+    questions: list[str]
+    checkpoint_path: str
+
+
+def cached_pages(path, cache_dir=PAGE_CACHE_DIR):
+    """
+    Parse the pages of a PDF, reusing the result of earlier runs.
+
+    Parsed pages are stored as JSON under the hash of the file content, so a
+    re-run skips parsing and an edited PDF is parsed again.
+
+    Args:
+        path (str): Path of the PDF.
+        cache_dir (str): Directory of the page cache.
+
+    Returns:
+        list: The text of each page.
+    """
+    cache_path = os.path.join(cache_dir, f"{file_hash(path)}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return json.load(f)["pages"]
+
+    pages = [page.page_content for page in PyPDFLoader(path).load()]
+
+    write_json(cache_path, {"path": path, "pages": pages})
+    return pages
+
+
+def save_checkpoint(state, update):
+    """
+    Merge a node's result into the document's checkpoint file, if it has one.
+
+    Nodes save their own results because a failing parallel branch discards
+    the results of the branches that finished in the same step.
+
+    Args:
+        state (dict): The current graph state.
+        update (dict): The node's result.
+
+    Returns:
+        dict: The update, unchanged.
+    """
+    checkpoint_path = state.get("checkpoint_path")
+    if checkpoint_path:
+        with _checkpoint_lock:
+            data = {}
+            if os.path.exists(checkpoint_path):
+                with open(checkpoint_path) as f:
+                    data = json.load(f)
+            data.update(update)
+            write_json(checkpoint_path, data)
+    return update
+
+
+def write_json(path, data):
+    """
+    Write JSON atomically, so an interrupted run never leaves a partial file.
+
+    Args:
+        path (str): The destination path.
+        data: The JSON-serialisable data.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def load_pages(state):
+    """
+    Load the pages of the document
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): New key added to state, pages, that contains the text of each page
+    """
+    print("---LOADING PAGES---")
+    return {"pages": cached_pages(state["path"])}
+
+
+def map_pages(chain, pages, max_concurrency=PAGE_CONCURRENCY):
+    """
+    Run a per-page chain over every page concurrently.
+
+    Args:
+        chain (Runnable): The per-page chain, taking pdf_content.
+        pages (list): The text of each page.
+        max_concurrency (int): The maximum number of pages in flight.
+
+    Returns:
+        str: The page outputs in page order, one per line, ready for the
+            formatter chain to reduce.
+    """
+    outputs = chain.batch(
+        [{"pdf_content": page} for page in pages],
+        config={"max_concurrency": max_concurrency},
+    )
+    return "".join(str(output) + "\n" for output in outputs)
+
+
+def extract_name_date(state):
+    """
+    Extract name and date of issue
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): New keys added to state, name and date_of_issue, that contain the name and date of issue
+    """
+    if state["name"] is not None:
+        # Restored from a checkpoint
+        return {"name": state["name"], "date_of_issue": state["date_of_issue"]}
+    print("---EXTRACTING NAME AND DATE---")
+    output = name_date_chain.invoke({"pdf_content": state["pages"][0]})
+    return save_checkpoint(
+        state,
+        {
+            "name": output["name"].replace("/", " "),
+            "date_of_issue": output["date_of_issue"],
+        },
+    )
+
+
+def extract_relationships(state):
+    """
+    Extract relationships
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): New key added to state, relations, that contains the relationships between the current document and other documents
+    """
+    if state["relations"] is not None:
+        return {"relations": state["relations"]}
+    print("---EXTRACTING RELATIONSHIPS---")
+    output = map_pages(page_relations_extractor_chain, state["pages"])
+    output = relations_json_formatter_chain.invoke({"unformatted_input": output})
+    output = repair_json(str(output))
+    output = json.loads(output)
+    return save_checkpoint(state, {"relations": output["relations"]})
+
+
+def summarize_document(state):
+    """
+    Summarize the document
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): New key added to state, summary, that contains the summary of the document
+    """
+    if state["summary"] is not None:
+        return {"summary": state["summary"]}
+    print("---SUMMARIZING DOCUMENT---")
+    output = map_pages(summary_chain, state["pages"])
+    output = summary_json_formatter_chain.invoke({"unformatted_input": output})
+    output = repair_json(str(output))
+    output = json.loads(output)
+    return save_checkpoint(state, {"summary": output["summary"]})
+
+
+def estimate_tokens(text):
+    """
+    Approximate the token count of a text, at about four characters per token.
+    """
+    return len(text) // 4 + 1
+
+
+def page_windows(pages, num_ctx=ONE_SHOT_NUM_CTX):
+    """
+    Group consecutive pages into windows that fit the one-shot context.
+
+    Args:
+        pages (list): The text of each page.
+        num_ctx (int): The model context window in tokens.
+
+    Returns:
+        list: The text of each window. A document that fits is a single
+            window, and a single page longer than a window gets its own.
+    """
+    budget = (
+        num_ctx
+        - ONE_SHOT_OUTPUT_TOKENS
+        - estimate_tokens(one_shot_chain.first.template)
+    )
+    windows = [[]]
+    used = 0
+    for page in pages:
+        tokens = estimate_tokens(page)
+        if windows[-1] and used + tokens > budget:
+            windows.append([])
+            used = 0
+        windows[-1].append(page)
+        used += tokens
+    return ["\n".join(window) for window in windows]
+
+
+def merge_windows(outputs, default_name=""):
+    """
+    Combine the one-shot outputs of the page windows of a document.
+
+    The name and date come from the first window that has them, relations and
+    questions are merged in page order, and the window summaries are reduced by
+    the summary formatter when there is more than one.
+
+    Args:
+        outputs (list): The parsed output of each window.
+        default_name (str): The name used when no window has one.
+
+    Returns:
+        dict: The name, date_of_issue, relations, summary and questions.
+    """
+    relations = {}
+    questions = []
+    for output in outputs:
+        for related_doc, relation_type in (output.get("relations") or {}).items():
+            relations.setdefault(related_doc, relation_type)
+        for question in output.get("questions") or []:
+            if question not in questions:
+                questions.append(question)
+
+    summary = outputs[0].get("summary", "")
+    if len(outputs) > 1:
+        summary = summary_json_formatter_chain.invoke(
+            {"unformatted_input": "\n".join(str(o.get("summary", "")) for o in outputs)}
+        )
+        summary = json.loads(repair_json(str(summary)))["summary"]
+
+    return {
+        "name": next(
+            (str(o["name"]) for o in outputs if o.get("name")), default_name
+        ).replace("/", " "),
+        "date_of_issue": next(
+            (o["date_of_issue"] for o in outputs if o.get("date_of_issue")), ""
+        ),
+        "relations": relations,
+        "summary": summary,
+        "questions": questions,
+    }
+
+
+def extract_one_shot(state):
+    """
+    Extract every field in one call per page window
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): New keys added to state, name, date_of_issue, relations, summary and questions
+    """
+    fields = ["name", "date_of_issue", "relations", "summary", "questions"]
+    if all(state[field] is not None for field in fields):
+        return {field: state[field] for field in fields}
+    print("---EXTRACTING IN ONE SHOT---")
+    outputs = one_shot_chain.batch(
+        [{"pdf_content": window} for window in page_windows(state["pages"])],
+        config={"max_concurrency": PAGE_CONCURRENCY},
+    )
+    outputs = [json.loads(repair_json(str(output))) for output in outputs]
+    stem = os.path.splitext(os.path.basename(state["path"]))[0]
+    return save_checkpoint(state, merge_windows(outputs, stem))
+
+
+def format_output(state):
+    """
+    Format the output
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): The formatted output
+    """
+    print("---FORMATTING OUTPUT---")
+    output = {
+        "name": state["name"],
+        "date_of_issue": state["date_of_issue"],
+        "summary": state["summary"],
+        "relations": state["relations"],
+    }
+    if state.get("questions") is not None:
+        output["questions"] = state["questions"]
+    output = repair_json(str(output))
+    output = json.loads(output)
+
+    write_json(output_path_for(state["name"]), output)
+
+    return state
+
+
+def output_path_for(name):
+    """
+    The path of the extraction JSON for a document name.
+    """
+    return os.path.join(OUTPUT_DIR, f"{name}.json")
+
+
+def build_app(mode=EXTRACTION_MODE):
+    """
+    Build the extraction graph.
+
+    Args:
+        mode (str): "multi" or "one_shot".
+
+    Returns:
+        CompiledGraph: The compiled graph.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+
+    workflow = StateGraph(GraphState)
+
+    workflow.add_node("load_pages", load_pages)
+    workflow.add_node("output_formatting", format_output)
+    workflow.add_edge(START, "load_pages")
+
+    if mode == "one_shot":
+        workflow.add_node("one_shot", extract_one_shot)
+        workflow.add_edge("load_pages", "one_shot")
+        workflow.add_edge("one_shot", "output_formatting")
+    else:
+        workflow.add_node("name_date", extract_name_date)
+        workflow.add_node("relationships", extract_relationships)
+        workflow.add_node("doc_summary", summarize_document)
+
+        # Name/date, relations and summary do not depend on each other, so they
+        # run as parallel branches. Each returns only its own keys, and
+        # output_formatting waits for all three.
+        workflow.add_edge("load_pages", "name_date")
+        workflow.add_edge("load_pages", "relationships")
+        workflow.add_edge("load_pages", "doc_summary")
+        workflow.add_edge(
+            ["name_date", "relationships", "doc_summary"], "output_formatting"
+        )
+
+    workflow.add_edge("output_formatting", END)
+
+    return workflow.compile()
+
+
+apps = {mode: build_app(mode) for mode in MODES}
+app = apps[EXTRACTION_MODE]
+
+
+def extract_document(path, checkpoint_path=None, mode=EXTRACTION_MODE, config=None):
+    """
+    Run the extraction graph on one PDF and save its JSON output.
+
+    Args:
+        path (str): Path of the PDF.
+        checkpoint_path (str): Optional checkpoint file. Every extraction node
+            saves its fields there, and a run that finds the file resumes from
+            it instead of repeating the finished LLM calls.
+        mode (str): "multi" or "one_shot".
+        config (dict): Optional runnable config, e.g. callbacks.
+
+    Returns:
+        dict: The final graph state.
+    """
+    inputs = {
+        "path": path,
+        "pages": [],
+        "name": None,
+        "date_of_issue": None,
+        "summary": None,
+        "relations": None,
+        "questions": None,
+        "checkpoint_path": checkpoint_path,
+    }
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            inputs.update(json.load(f))
+        print(f"---RESUMING {path} FROM CHECKPOINT---")
+
+    start = time.perf_counter()
+    state = dict(inputs)
+    # Parallel branches stream their updates separately, so merge them
+    for output in apps[mode].stream(inputs, config=config):
+        for key, value in output.items():
+            state.update(value)
+            print("---" * 5)
+            print(f"{key}: { {k: v for k, v in value.items() if k != 'pages'} }")
+            print("---" * 5)
+    print(f"---EXTRACTED {state['name']} in {time.perf_counter() - start:.1f}s---")
+    return state
+
+
+def extract_directory(directory_path, manifest_path=MANIFEST_PATH):
+    """
+    Extract every new or changed PDF in a directory.
+
+    Only PDFs the manifest has not recorded are sent to the LLM, and removed
+    ones lose their output.
+
+    Args:
+        directory_path (str): The directory containing the PDFs.
+        manifest_path (str): The ingestion manifest database.
+    """
+    manifest = Manifest(manifest_path)
+    manifest.sync_folder(directory_path)
+    manifest.purge_outputs()
+
+    for row in manifest.pending("extraction"):
+        print(f"Processing {row['path']}...")
+        state = extract_document(row["path"])
+        manifest.mark_done(
+            row["content_hash"],
+            "extraction",
+            name=state["name"],
+            output_path=os.path.abspath(output_path_for(state["name"])),
+        )
+
+
+if __name__ == "__main__":
+    extract_directory("circulars2/")
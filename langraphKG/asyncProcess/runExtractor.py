@@ -0,0 +1,140 @@
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import relationsExtractor as rx
+from manifest import Manifest
+from paths import MANIFEST_PATH
+
+# Documents extracted at the same time
+WORKERS = 2
+CHECKPOINT_DIR = "./checkpoints"
+
+
+def checkpoint_path_for(content_hash, checkpoint_dir=CHECKPOINT_DIR):
+    return os.path.join(checkpoint_dir, f"{content_hash}.json")
+
+
+def extract_row(manifest, row, checkpoint_dir, mode=rx.EXTRACTION_MODE):
+    """
+    Extract one manifest row and record it as done.
+
+    Args:
+        manifest (Manifest): The ingestion manifest.
+        row (Row): The pending manifest row.
+        checkpoint_dir (str): Directory of the per-document checkpoints.
+        mode (str): "multi" or "one_shot".
+
+    Returns:
+        tuple: The final graph state and the extraction time in seconds.
+    """
+    start = time.perf_counter()
+    checkpoint_path = checkpoint_path_for(row["content_hash"], checkpoint_dir)
+    state = rx.extract_document(row["path"], checkpoint_path=checkpoint_path, mode=mode)
+    manifest.mark_done(
+        row["content_hash"],
+        "extraction",
+        name=state["name"],
+        output_path=os.path.abspath(rx.output_path_for(state["name"])),
+    )
+    # The output is saved and recorded, so the checkpoint is no longer needed
+    os.remove(checkpoint_path)
+    return state, time.perf_counter() - start
+
+
+def run(
+    directory_path,
+    workers=WORKERS,
+    manifest_path=MANIFEST_PATH,
+    checkpoint_dir=CHECKPOINT_DIR,
+    mode=rx.EXTRACTION_MODE,
+):
+    """
+    Extract every new or changed PDF in a directory with a pool of workers.
+
+    Finished documents are recorded in the manifest, so a re-run skips them.
+    Documents interrupted mid-way resume from their checkpoint. A failed
+    document is reported and left pending for the next run.
+
+    Args:
+        directory_path (str): The directory containing the PDFs.
+        workers (int): Documents extracted at the same time.
+        manifest_path (str): The ingestion manifest database.
+        checkpoint_dir (str): Directory of the per-document checkpoints.
+        mode (str): "multi" or "one_shot".
+
+    Returns:
+        dict: Counts, failures and timings of the run.
+    """
+    manifest = Manifest(manifest_path)
+    manifest.sync_folder(directory_path)
+    manifest.purge_outputs()
+    rows = manifest.pending("extraction")
+    resumed = sum(
+        os.path.exists(checkpoint_path_for(row["content_hash"], checkpoint_dir))
+        for row in rows
+    )
+    print(f"---{len(rows)} PENDING DOCUMENTS, {resumed} WITH CHECKPOINTS---")
+
+    durations = []
+    failures = {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(extract_row, manifest, row, checkpoint_dir, mode): row
+            for row in rows
+        }
+        for future in as_completed(futures):
+            row = futures[future]
+            try:
+                state, seconds = future.result()
+            # Any error fails only this document, recorded for the next run
+            except Exception as e:  # noqa: BLE001
+                failures[row["path"]] = repr(e)
+                print(f"---FAILED {row['path']}: {e!r}---")
+            else:
+                durations.append(seconds)
+                print(f"---DONE {state['name']} ({len(durations)}/{len(rows)})---")
+    wall = time.perf_counter() - start
+
+    return {
+        "pending": len(rows),
+        "resumed": resumed,
+        "succeeded": len(durations),
+        "failed": failures,
+        "wall_seconds": wall,
+        "docs_per_minute": 60 * len(durations) / wall if wall else 0.0,
+        "mean_seconds": statistics.mean(durations) if durations else 0.0,
+        "max_seconds": max(durations, default=0.0),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract a directory of circulars with the LangGraph extractor."
+    )
+    parser.add_argument("directory", nargs="?", default="circulars2/")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    parser.add_argument("--mode", choices=rx.MODES, default=rx.EXTRACTION_MODE)
+    args = parser.parse_args()
+
+    report = run(
+        args.directory, args.workers, args.manifest, args.checkpoint_dir, args.mode
+    )
+
+    print("---EXTRACTION REPORT---")
+    print(
+        f"{report['pending']} pending, {report['resumed']} resumed, "
+        f"{report['succeeded']} succeeded, {len(report['failed'])} failed"
+    )
+    print(
+        f"Wall time {report['wall_seconds']:.1f}s, "
+        f"{report['docs_per_minute']:.2f} docs/min, "
+        f"{report['mean_seconds']:.1f}s mean and {report['max_seconds']:.1f}s max per document"
+    )
+    for path, error in report["failed"].items():
+        print(f"Failed: {path}: {error}")
@@ -0,0 +1,112 @@
+import argparse
+import statistics
+import time
+
+from hybridRetriever import HybridRetriever
+from resourcePool import pool
+
+QUESTIONS_QUERY = """
+MATCH (d:GovernmentDocument)
+WHERE d.questions IS NOT NULL
+UNWIND d.questions AS question
+RETURN d.name AS name, question
+ORDER BY name
+"""
+
+
+def load_questions(graph, limit=None):
+    """
+    Read the questions stored on each GovernmentDocument node.
+
+    Args:
+        graph (Neo4jGraph): The Neo4j graph.
+        limit (int): Optional maximum number of questions.
+
+    Returns:
+        list: (document name, question) pairs.
+    """
+    rows = graph.query(QUESTIONS_QUERY)
+    pairs = [(row["name"], row["question"]) for row in rows]
+    return pairs[:limit] if limit else pairs
+
+
+def top1_ranking(resources, question):
+    """
+    The single document the top-1 find_context route used to answer from: the
+    first neighbor of the best summary hit, or the hit itself.
+    """
+    hits = resources.vecFromGraphDB.similarity_search_with_relevance_scores(question)
+    name = hits[0][0].metadata["name"]
+    neighbors = resources.neighborhoods.lookup(name)
+    return [neighbors[0]["connected"]["name"] if neighbors else name]
+
+
+def summary_ranking(resources, question, k):
+    hits = resources.vecFromGraphDB.similarity_search_with_relevance_scores(
+        question, k=k
+    )
+    return [doc.metadata["name"] for doc, _ in hits]
+
+
+def evaluate(rank, questions, ks):
+    """
+    Measure recall@k and latency of one retrieval method.
+
+    Recall@k is the share of questions whose source document is among the first
+    k documents the method returns.
+
+    Args:
+        rank (callable): Returns the ranked document names for a question.
+        questions (list): (document name, question) pairs.
+        ks (list): The cut-offs to report.
+
+    Returns:
+        dict: recall@k for every k and p50 / p95 latency in seconds.
+    """
+    found = {k: 0 for k in ks}
+    latencies = []
+    for name, question in questions:
+        start = time.perf_counter()
+        ranking = rank(question)
+        latencies.append(time.perf_counter() - start)
+        for k in ks:
+            found[k] += name in ranking[:k]
+
+    latencies.sort()
+    results = {f"recall@{k}": found[k] / len(questions) for k in ks}
+    results["p50"] = statistics.median(latencies)
+    results["p95"] = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evaluate top-1, summary-only and hybrid retrieval on the questions stored in the graph."
+    )
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    resources = pool.get()
+    questions = load_questions(resources.graph, args.limit)
+    retriever = HybridRetriever(
+        resources.vector_db,
+        resources.neighborhoods,
+        resources.vecFromGraphDB,
+        fused_documents=max(args.k),
+    )
+
+    methods = {
+        "top-1": lambda q: top1_ranking(resources, q),
+        "summary": lambda q: summary_ranking(resources, q, max(args.k)),
+        "hybrid": lambda q: [name for name, _ in retriever.retrieve(q)["documents"]],
+    }
+    results = {
+        method: evaluate(rank, questions, args.k) for method, rank in methods.items()
+    }
+
+    print("---RETRIEVAL EVALUATION---")
+    print(f"{len(questions)} questions")
+    for method, r in results.items():
+        recalls = " ".join(f"recall@{k}={r[f'recall@{k}']:.1%}" for k in args.k)
+        print(f"{method:<8} {recalls} p50={r['p50']:.3f}s p95={r['p95']:.3f}s")
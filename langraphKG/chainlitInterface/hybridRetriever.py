@@ -0,0 +1,197 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Summary hits taken from the Neo4j vector index
+TOP_K = 5
+# Chunk hits taken from Chroma across all documents
+CHUNK_K = 8
+# Chunks taken from each fused document
+CHUNKS_PER_DOCUMENT = 2
+# Documents kept after fusion
+FUSED_DOCUMENTS = 4
+# Graph neighbors of every summary hit
+NEIGHBOR_DEPTH = 1
+NEIGHBOR_RELATIONS = ["AMENDED", "SUPERSEDED", "REFERENCED"]
+NEIGHBOR_DIRECTION = "both"
+# Reciprocal-rank fusion constant, from Cormack et al. (2009)
+RRF_K = 60
+# Approximate tokens of context passed to the LLM, within its 16k window
+TOKEN_BUDGET = 6000
+# A chunk is truncated to fit the budget only if this many tokens are left
+MIN_CHUNK_TOKENS = 200
+
+# Threads for the lookups of a single question, separate from the per-request
+# executor in queryPath so that nested lookups cannot starve each other
+LOOKUP_WORKERS = 8
+
+lookup_executor = ThreadPoolExecutor(
+    max_workers=LOOKUP_WORKERS, thread_name_prefix="hybrid_lookup"
+)
+
+
+def estimate_tokens(text):
+    """
+    Approximate the token count of a text, at about four characters per token.
+    """
+    return len(text) // 4 + 1
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked lists by summing 1 / (k + rank) over the lists an item is in.
+
+    Args:
+        rankings (list): Ranked lists of items, best first.
+        k (int): The fusion constant.
+
+    Returns:
+        list: (item, score) pairs, best first, ties broken by item.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))
+
+
+class HybridRetriever:
+    """
+    Graph and vector retrieval over several hits instead of only the best one.
+
+    Three rankings of documents are fused with reciprocal-rank fusion: the top-k
+    summary hits from the Neo4j vector index, the amending, superseding and
+    referenced neighbors of those hits, and the documents of the top Chroma
+    chunk hits. The best chunks of the fused documents are then packed into the
+    context up to a token budget. Independent lookups run concurrently.
+    """
+
+    def __init__(
+        self,
+        vector_db,
+        neighborhoods,
+        vecFromGraphDB,
+        top_k=TOP_K,
+        chunk_k=CHUNK_K,
+        chunks_per_document=CHUNKS_PER_DOCUMENT,
+        fused_documents=FUSED_DOCUMENTS,
+        token_budget=TOKEN_BUDGET,
+    ):
+        self.vector_db = vector_db
+        self.neighborhoods = neighborhoods
+        self.vecFromGraphDB = vecFromGraphDB
+        self.top_k = top_k
+        self.chunk_k = chunk_k
+        self.chunks_per_document = chunks_per_document
+        self.fused_documents = fused_documents
+        self.token_budget = token_budget
+
+    def retrieve(self, query):
+        """
+        Retrieve the context of a question.
+
+        Args:
+            query (str): The user question.
+
+        Returns:
+            dict: The packed context, the fused (name, score) documents, the
+                chunks in the context, its approximate token count and the
+                retrieval time.
+        """
+        start = time.perf_counter()
+
+        summary_future = lookup_executor.submit(
+            self.vecFromGraphDB.similarity_search_with_relevance_scores,
+            query,
+            k=self.top_k,
+        )
+        chunk_future = lookup_executor.submit(
+            self.vector_db.similarity_search, query, k=self.chunk_k
+        )
+        summary_ranking = _unique(
+            doc.metadata["name"] for doc, _ in summary_future.result()
+        )
+
+        neighbors = list(lookup_executor.map(self._neighbors, summary_ranking))
+        # Nearest neighbors first, then neighbors of better summary hits first
+        graph_ranking = _unique(
+            row["connected"]["name"]
+            for _, _, row in sorted(
+                (
+                    (row["hops"], hit_rank, row)
+                    for hit_rank, rows in enumerate(neighbors)
+                    for row in rows
+                    # Related-only nodes have no summary and nothing in Chroma
+                    if row["connected"].get("summary")
+                ),
+                key=lambda entry: entry[:2],
+            )
+        )
+        chunk_ranking = _unique(
+            chunk.metadata["name"] for chunk in chunk_future.result()
+        )
+
+        documents = reciprocal_rank_fusion(
+            [summary_ranking, graph_ranking, chunk_ranking]
+        )[: self.fused_documents]
+        names = [name for name, _ in documents]
+        chunks = list(
+            lookup_executor.map(self._document_chunks, [query] * len(names), names)
+        )
+
+        context, packed, tokens = self._pack(names, chunks)
+        return {
+            "context": context,
+            "documents": documents,
+            "chunks": packed,
+            "tokens": tokens,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _neighbors(self, name):
+        return self.neighborhoods.lookup(
+            name,
+            depth=NEIGHBOR_DEPTH,
+            relation_types=NEIGHBOR_RELATIONS,
+            direction=NEIGHBOR_DIRECTION,
+        )
+
+    def _document_chunks(self, query, name):
+        return self.vector_db.similarity_search(
+            query, k=self.chunks_per_document, filter={"name": name}
+        )
+
+    def _pack(self, names, chunks):
+        # Round-robin over the documents, so the budget is spread across them
+        ordered = [
+            (names[i], document_chunks[position])
+            for position in range(self.chunks_per_document)
+            for i, document_chunks in enumerate(chunks)
+            if position < len(document_chunks)
+        ]
+
+        pieces = []
+        packed = []
+        seen = set()
+        remaining = self.token_budget
+        for name, chunk in ordered:
+            text = chunk.page_content
+            if (name, text) in seen:
+                continue
+            seen.add((name, text))
+            cost = estimate_tokens(text)
+            if cost > remaining:
+                if remaining < MIN_CHUNK_TOKENS:
+                    break
+                text = text[: (remaining - 1) * 4]
+                cost = estimate_tokens(text)
+            page = chunk.metadata.get("page")
+            source = f"{name}, page {page}" if page else name
+            pieces.append(f"Source: {source}\n{text}")
+            packed.append({"name": name, "text": text, "metadata": chunk.metadata})
+            remaining -= cost
+
+        return "\n\n---\n\n".join(pieces), packed, self.token_budget - remaining
+
+
+def _unique(items):
+    return list(dict.fromkeys(items))
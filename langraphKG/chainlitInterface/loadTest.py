@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+import queryPath
+from resourcePool import pool
+
+# Questions over the circulars indexed in ./chroma and Neo4j
+QUESTIONS = [
+    "To what investments do the concentration norms not apply?",
+    "Can FPIs invest in capital market securities?",
+    "Can FPIs invest in unlisted corporate debt securities?",
+    "What is the minimum residual maturity for FPI investment in corporate bonds?",
+    "Which circulars were withdrawn by the Reserve Bank of India?",
+    "What are the reporting requirements for FPI investments in debt securities?",
+]
+
+
+async def blocking_user(resources, question, arrived):
+    queryPath.answer_blocking(resources, question)
+    return time.perf_counter() - arrived
+
+
+async def async_user(resources, question, arrived):
+    await queryPath.answer(resources, question)
+    return time.perf_counter() - arrived
+
+
+async def heartbeat(lags, stop, interval=0.05):
+    """
+    Record how late the event loop wakes up, i.e. how long it was blocked.
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - expected)
+
+
+async def run(user, resources, users):
+    """
+    Run users concurrent chat requests through one query path.
+
+    Args:
+        user (coroutine function): blocking_user or async_user.
+        resources (ResourcePool): The shared resources.
+        users (int): The number of concurrent users.
+
+    Returns:
+        dict: Per-request latency percentiles, measured from the moment all
+            requests arrive, wall time and event-loop lag.
+    """
+    # Every run starts from a cold neighborhood cache, so the second path is not
+    # measured on the hits the first one left behind
+    resources.neighborhoods.invalidate()
+    lags = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(lags, stop))
+    start = time.perf_counter()
+    latencies = await asyncio.gather(
+        *[user(resources, QUESTIONS[i % len(QUESTIONS)], start) for i in range(users)]
+    )
+    wall = time.perf_counter() - start
+    stop.set()
+    await monitor
+
+    latencies = sorted(latencies)
+    return {
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+        "max": latencies[-1],
+        "wall": wall,
+        "max_loop_lag": max(lags, default=0.0),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare concurrent-user latency of the blocking and async query paths."
+    )
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+
+    resources = pool.get()
+    results = {
+        "blocking": asyncio.run(run(blocking_user, resources, args.users)),
+        "async": asyncio.run(run(async_user, resources, args.users)),
+    }
+
+    print("---LOAD TEST---")
+    print(f"{args.users} concurrent users")
+    for path, r in results.items():
+        print(
+            f"{path:<9} p50={r['p50']:.2f}s p95={r['p95']:.2f}s max={r['max']:.2f}s "
+            f"wall={r['wall']:.2f}s max_loop_lag={r['max_loop_lag']:.2f}s"
+        )
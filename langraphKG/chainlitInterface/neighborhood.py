@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Deepest neighborhood that may be requested, in hops
+MAX_DEPTH = 3
+# Least recently used neighborhoods are evicted beyond this many entries
+CACHE_SIZE = 1024
+# Seconds between checks of the graph version written by the loaders
+VERSION_CHECK_INTERVAL = 5
+
+# Edges point from a document to the documents it relates to, so "in" finds the
+# documents that amend, supersede or refer to the start document.
+PATTERNS = {
+    "in": "(start)<-[*1..{depth}]-(connected:GovernmentDocument)",
+    "out": "(start)-[*1..{depth}]->(connected:GovernmentDocument)",
+    "both": "(start)-[*1..{depth}]-(connected:GovernmentDocument)",
+}
+
+NEIGHBORHOOD_QUERY = """
+MATCH (start:GovernmentDocument {{name: $name}})
+MATCH p = {pattern}
+WHERE connected <> start
+  AND ($relation_types IS NULL
+       OR all(r IN relationships(p) WHERE type(r) IN $relation_types))
+WITH connected, p
+ORDER BY length(p)
+WITH connected, head(collect(p)) AS p
+RETURN connected {{.name, .date_of_issue, .summary}} AS connected,
+       length(p) AS hops,
+       [r IN relationships(p) | type(r)] AS relations
+ORDER BY hops, connected.name
+LIMIT $limit
+"""
+
+GRAPH_VERSION_QUERY = "MATCH (m:GraphMeta {key: 'graph'}) RETURN m.version AS version"
+
+
+def neighborhood_query(depth=1, direction="in"):
+    """
+    Build the neighborhood Cypher for a hop depth and direction.
+
+    Variable-length bounds cannot be parameterised, so the depth is validated
+    and written into the query. Everything else is a parameter, so there is one
+    cached query plan per (depth, direction).
+
+    Args:
+        depth (int): The maximum number of hops, between 1 and MAX_DEPTH.
+        direction (str): "in", "out" or "both".
+
+    Returns:
+        str: The Cypher query.
+    """
+    if not isinstance(depth, int) or not 1 <= depth <= MAX_DEPTH:
+        raise ValueError(f"depth must be an integer between 1 and {MAX_DEPTH}")
+    if direction not in PATTERNS:
+        raise ValueError(f"direction must be one of {sorted(PATTERNS)}")
+    return NEIGHBORHOOD_QUERY.format(pattern=PATTERNS[direction].format(depth=depth))
+
+
+class NeighborhoodCache:
+    """
+    LRU cache of GovernmentDocument neighborhoods.
+
+    Entries are keyed by document, depth, relation filter, direction and limit.
+    The whole cache is dropped when the graph version on the GraphMeta node
+    changes, which the neo4jKG loaders do after every load.
+    """
+
+    def __init__(
+        self,
+        graph,
+        max_entries=CACHE_SIZE,
+        version_check_interval=VERSION_CHECK_INTERVAL,
+    ):
+        self.graph = graph
+        self.max_entries = max_entries
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = self._graph_version()
+        self._checked_at = time.monotonic()
+
+    def lookup(self, name, depth=1, relation_types=None, direction="in", limit=25):
+        """
+        Return the documents around a document.
+
+        Args:
+            name (str): The start document name.
+            depth (int): The maximum number of hops.
+            relation_types (list): Relationship types every hop must have, e.g.
+                ["AMENDED", "SUPERSEDED"], or None for any type.
+            direction (str): "in", "out" or "both".
+            limit (int): The maximum number of neighbors.
+
+        Returns:
+            list: One dict per neighbor, nearest first, with the neighbor's
+                properties under "connected", its distance under "hops" and the
+                relationship types on the way under "relations".
+        """
+        if relation_types is not None:
+            relation_types = sorted({t.upper() for t in relation_types})
+        key = (
+            name,
+            depth,
+            tuple(relation_types) if relation_types is not None else None,
+            direction,
+            limit,
+        )
+        self._check_version()
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(self._entries[key])
+            self.misses += 1
+
+        results = self.graph.query(
+            neighborhood_query(depth, direction),
+            {"name": name, "relation_types": relation_types, "limit": limit},
+        )
+
+        with self._lock:
+            self._entries[key] = results
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return list(results)
+
+    def invalidate(self):
+        """
+        Drop every cached neighborhood.
+        """
+        with self._lock:
+            self._entries.clear()
+        print("---NEIGHBORHOOD CACHE: INVALIDATED---")
+
+    def _graph_version(self):
+        results = self.graph.query(GRAPH_VERSION_QUERY)
+        return results[0]["version"] if results else None
+
+    def _check_version(self):
+        if time.monotonic() - self._checked_at < self.version_check_interval:
+            return
+        self._checked_at = time.monotonic()
+        version = self._graph_version()
+        if version != self._version:
+            self._version = version
+            self.invalidate()
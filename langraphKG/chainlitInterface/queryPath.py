@@ -0,0 +1,123 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from hybridRetriever import HybridRetriever
+
+# Threads for the blocking vector and graph lookups, shared by every session
+CONTEXT_WORKERS = 8
+# Seconds allowed to find the context of a question
+CONTEXT_TIMEOUT = 30
+# Seconds allowed to generate the answer to a question
+ANSWER_TIMEOUT = 120
+
+executor = ThreadPoolExecutor(
+    max_workers=CONTEXT_WORKERS, thread_name_prefix="find_context"
+)
+
+
+def find_context(user_query, vector_db, neighborhoods, vecFromGraphDB):
+    retriever = HybridRetriever(vector_db, neighborhoods, vecFromGraphDB)
+    return retriever.retrieve(user_query)["context"]
+
+
+async def afind_context(resources, user_query, timeout=CONTEXT_TIMEOUT):
+    """
+    Find the context of a question without blocking the event loop.
+
+    The Chroma, Neo4j vector and neighborhood lookups have no async client, so
+    they run on a bounded executor shared by every session.
+
+    Args:
+        resources (ResourcePool): The shared resources.
+        user_query (str): The user question.
+        timeout (float): Seconds to wait for the lookups.
+
+    Returns:
+        str: The retrieved context.
+
+    Raises:
+        TimeoutError: If the lookups take longer than timeout.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(
+        loop.run_in_executor(
+            executor,
+            find_context,
+            user_query,
+            resources.vector_db,
+            resources.neighborhoods,
+            resources.vecFromGraphDB,
+        ),
+        timeout,
+    )
+
+
+async def astream_answer(rag, user_query, context, timeout=ANSWER_TIMEOUT):
+    """
+    Stream the answer tokens, giving up once the whole answer exceeds timeout.
+
+    Args:
+        rag (Runnable): The RAG chain.
+        user_query (str): The user question.
+        context (str): The retrieved context.
+        timeout (float): Seconds allowed for the whole answer.
+
+    Yields:
+        str: The answer tokens.
+
+    Raises:
+        TimeoutError: If the answer takes longer than timeout.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    stream = rag.astream({"question": user_query, "context": context}).__aiter__()
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError
+            try:
+                token = await asyncio.wait_for(stream.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            yield token
+    finally:
+        await stream.aclose()
+
+
+async def answer(resources, user_query):
+    """
+    Answer a question on the async path.
+
+    Args:
+        resources (ResourcePool): The shared resources.
+        user_query (str): The user question.
+
+    Returns:
+        str: The answer.
+    """
+    context = await afind_context(resources, user_query)
+    tokens = [
+        token async for token in astream_answer(resources.rag, user_query, context)
+    ]
+    return "".join(tokens)
+
+
+def answer_blocking(resources, user_query):
+    """
+    Answer a question on the blocking path the Chainlit handler used before.
+
+    Args:
+        resources (ResourcePool): The shared resources.
+        user_query (str): The user question.
+
+    Returns:
+        str: The answer.
+    """
+    context = find_context(
+        user_query,
+        resources.vector_db,
+        resources.neighborhoods,
+        resources.vecFromGraphDB,
+    )
+    return resources.rag.invoke({"question": user_query, "context": context})
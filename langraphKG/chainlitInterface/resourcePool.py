@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+
+from langchain.prompts import PromptTemplate
+from langchain_chroma import Chroma
+from langchain_community.graphs import Neo4jGraph
+from langchain_community.vectorstores import Neo4jVector
+from langchain_core.output_parsers import StrOutputParser
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_ollama import ChatOllama
+from load_dotenv import load_dotenv
+from neighborhood import NeighborhoodCache
+
+load_dotenv()
+ollama_base_url = ""
+
+if os.getenv("BASE_URL"):
+    ollama_base_url = os.getenv("BASE_URL")
+else:
+    ollama_base_url = None
+
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_USERNAME = "neo4j"
+NEO4J_PASSWORD = "yourpassword"
+
+# Connections kept by the shared Neo4j driver for all chat sessions
+NEO4J_POOL_SIZE = 50
+# Seconds between health checks of the shared connections
+HEALTH_CHECK_INTERVAL = 30
+
+
+class ResourcePool:
+    """
+    Application-wide resources shared by every Chainlit session.
+
+    The embedding model, Chroma client, Neo4j driver, summary vector index,
+    neighborhood cache and RAG chain are built once, when the server starts,
+    instead of once per chat. The Neo4j connections are health-checked
+    periodically and re-opened when the database becomes unreachable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self.embeddings = None
+        self.vector_db = None
+        self.graph = None
+        self.vecFromGraphDB = None
+        self.neighborhoods = None
+        self.rag = None
+
+    def initialize(self):
+        """
+        Build every resource that is not built yet.
+        """
+        with self._lock:
+            if self.embeddings is None:
+                start = time.perf_counter()
+                self.embeddings = HuggingFaceEmbeddings(
+                    model_name="nomic-ai/nomic-embed-text-v1.5",
+                    model_kwargs={"device": "cuda", "trust_remote_code": True},
+                )
+                self.vector_db = Chroma(
+                    collection_name="rag-chroma",
+                    persist_directory="./chroma",
+                    embedding_function=self.embeddings,
+                )
+                self.rag = rag_chain()
+                print(f"---LOADED MODELS in {time.perf_counter() - start:.2f}s---")
+            if self.graph is None:
+                self._connect()
+                self._checked_at = time.monotonic()
+
+    def _connect(self):
+        """
+        Open new Neo4j connections, swap them in, then close the old driver.
+
+        The new connections are complete before the swap, so requests never
+        pick up a closed or half-built graph from the pool.
+        """
+        start = time.perf_counter()
+        graph = PooledNeo4jGraph(
+            url=NEO4J_URI,
+            username=NEO4J_USERNAME,
+            password=NEO4J_PASSWORD,
+            refresh_schema=False,
+            driver_config={"max_connection_pool_size": NEO4J_POOL_SIZE},
+        )
+        # Reuses the graph's driver, so both share one connection pool. Summaries
+        # without an embedding are embedded here, once per server start.
+        vecFromGraphDB = Neo4jVector.from_existing_graph(
+            embedding=self.embeddings,
+            graph=graph,
+            index_name="vecFromGraph",
+            node_label="GovernmentDocument",
+            text_node_properties=["summary"],
+            embedding_node_property="embedding",
+        )
+        neighborhoods = NeighborhoodCache(graph)
+
+        old_graph = self.graph
+        self.graph = graph
+        self.vecFromGraphDB = vecFromGraphDB
+        self.neighborhoods = neighborhoods
+        print(f"---CONNECTED TO NEO4J in {time.perf_counter() - start:.2f}s---")
+        if old_graph is not None:
+            _close_driver(old_graph)
+
+    def health_check(self):
+        """
+        Check that Neo4j and Chroma answer.
+
+        Returns:
+            bool: Whether both stores are reachable.
+        """
+        try:
+            self.graph.query("RETURN 1")
+            self.vector_db.get(limit=1, include=[])
+            return True
+        # Whatever the error, the stores are not usable and get() reconnects
+        except Exception as e:  # noqa: BLE001
+            print(f"---HEALTH CHECK FAILED: {e}---")
+            return False
+
+    def get(self):
+        """
+        Return the pool, reconnecting to Neo4j if the last health check is stale
+        and fails.
+
+        Returns:
+            ResourcePool: The initialised pool.
+        """
+        self.initialize()
+        if time.monotonic() - self._checked_at > HEALTH_CHECK_INTERVAL:
+            with self._lock:
+                if time.monotonic() - self._checked_at > HEALTH_CHECK_INTERVAL:
+                    if not self.health_check():
+                        try:
+                            self._connect()
+                        # Keep the old connections, retry at the next check
+                        except Exception as e:  # noqa: BLE001
+                            print(f"---RECONNECTING TO NEO4J FAILED: {e}---")
+                    self._checked_at = time.monotonic()
+        return self
+
+    def close(self):
+        """
+        Close the shared Neo4j driver.
+        """
+        if self.graph is None:
+            print("---NO NEO4J DRIVER TO CLOSE---")
+            return
+        _close_driver(self.graph)
+
+
+class PooledNeo4jGraph(Neo4jGraph):
+    """
+    Neo4jGraph that can close the driver it creates.
+
+    The Neo4jGraph of langchain_community 0.3.2 has no close(), so the pool
+    would otherwise have to reach into the graph to release its connections.
+    """
+
+    def close(self):
+        self._driver.close()
+
+
+def _close_driver(graph):
+    try:
+        graph.close()
+        print("---CLOSED NEO4J DRIVER---")
+    # A driver that fails to close must not stop the swap or the shutdown
+    except Exception as e:  # noqa: BLE001
+        print(f"---CLOSING NEO4J DRIVER FAILED: {e}---")
+
+
+def rag_chain():
+    llm = ChatOllama(
+        base_url=ollama_base_url,
+        model="llama3.1",
+        temperature=0,
+        num_ctx=16000,
+        verbose=True,
+    )
+
+    prompt = PromptTemplate(
+        template="""You are an legal question-answering agent. Use the following pieces of retrieved context which are part of circulars by the government and your experience to understand to create an answer relevant to the query containing all pertinent information required to answer the question. Make sure the answer is of an appropriate length containing specifics about the query's response. If you don't know the answer, just say that you don't know. Please only provide the answer in the output.
+
+        Question: {question} 
+
+        Context: {context} 
+
+        Answer:""",
+        input_variables=["question", "context"],
+    )
+
+    return prompt | llm | StrOutputParser()
+
+
+pool = ResourcePool()
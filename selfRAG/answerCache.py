@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Minimum cosine similarity for a cached answer to be reused for a new question
+SIMILARITY_THRESHOLD = 0.92
+# Cached answers expire after this many seconds
+TTL_SECONDS = 24 * 60 * 60
+# Least recently used answers are evicted beyond this many entries
+MAX_ENTRIES = 512
+
+
+def normalize_question(question):
+    """
+    Normalise a question for exact-match lookups.
+
+    Case, surrounding punctuation and repeated whitespace are ignored.
+    """
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.strip(" ?.!")
+
+
+class AnswerCache:
+    """
+    Cache of final self-RAG answers in front of the agent graph.
+
+    A question is looked up by its normalised text first, then by embedding
+    similarity against the cached questions. Entries expire after a TTL, the
+    least recently used ones are evicted beyond a maximum size, and the whole
+    cache is dropped when the underlying Chroma collection changes.
+    """
+
+    def __init__(
+        self,
+        embeddings,
+        vectorstore,
+        persist_directory,
+        similarity_threshold=SIMILARITY_THRESHOLD,
+        ttl_seconds=TTL_SECONDS,
+        max_entries=MAX_ENTRIES,
+    ):
+        self.embeddings = embeddings
+        self.vectorstore = vectorstore
+        self.persist_directory = persist_directory
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._fingerprint = self._collection_fingerprint()
+
+    def lookup(self, question):
+        """
+        Return the cached answer for a question, or None on a miss.
+
+        Args:
+            question (str): The user question.
+
+        Returns:
+            str: The cached answer, or None.
+        """
+        self._check_collection()
+        key = normalize_question(question)
+
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                print("---ANSWER CACHE: EXACT HIT---")
+                return entry["answer"]
+            if not self._entries:
+                self.misses += 1
+                return None
+
+        vector = self._embed(question)
+        with self._lock:
+            best_key, best_score = None, -1.0
+            for cached_key, entry in self._entries.items():
+                score = float(np.dot(vector, entry["vector"]))
+                if score > best_score:
+                    best_key, best_score = cached_key, score
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                print(f"---ANSWER CACHE: SEMANTIC HIT ({best_score:.3f})---")
+                return self._entries[best_key]["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, question, answer):
+        """
+        Cache the answer to a question.
+
+        Args:
+            question (str): The user question.
+            answer (str): The final answer from the agent.
+        """
+        key = normalize_question(question)
+        vector = self._embed(question)
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "vector": vector,
+                "created": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """
+        Drop every cached answer.
+        """
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        print("---ANSWER CACHE: INVALIDATED---")
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [
+            key
+            for key, entry in self._entries.items()
+            if now - entry["created"] > self.ttl_seconds
+        ]:
+            del self._entries[key]
+
+    def _collection_fingerprint(self):
+        sqlite_path = os.path.join(self.persist_directory, "chroma.sqlite3")
+        mtime = os.path.getmtime(sqlite_path) if os.path.exists(sqlite_path) else None
+        count = len(self.vectorstore.get(include=[])["ids"])
+        return count, mtime
+
+    def _check_collection(self):
+        # Compared and cleared under the lock, so a store from another thread
+        # cannot land between the check and the clear
+        with self._lock:
+            fingerprint = self._collection_fingerprint()
+            if fingerprint != self._fingerprint:
+                self._fingerprint = fingerprint
+                self._clear()
@@ -1,5 +1,14 @@
 import chainlit as cl
 import selfRAGAgentHF as sra
+from answerCache import AnswerCache
+from resources import registry
+
+# Load the embedding model and vector store once, when the server starts
+sra.warm_up()
+
+answer_cache = AnswerCache(
+    sra.get_embeddings(), sra.get_vectorstore(), sra.chroma_directory
+)
 
 
 def load_agent():
@@ -13,17 +22,71 @@ async def on_chat_start():
     cl.user_session.set("agent", agent)
 
 
+# Step shown in the UI while each graph node runs
+STEPS = {
+    "retrieve": ("Retrieving circulars", "retrieval"),
+    "grade_documents": ("Grading document relevance", "tool"),
+    "transform_query": ("Rewriting the question", "tool"),
+    "generate": ("Generating the answer", "llm"),
+}
+
+
 @cl.on_message
 async def main(message: cl.Message):
+    # Repeated questions are answered from the cache without any LLM call
+    cached = await cl.make_async(answer_cache.lookup)(message.content)
+    if cached is not None:
+        await cl.Message(content=cached).send()
+        return
+
     agent = cl.user_session.get("agent")
     inputs = {
         "question": message.content,
         "iterations": 0,
+        "gave_up": False,
     }
-    async for output in agent.astream(inputs):
-        for key, value in output.items():
+
+    answer_msg = cl.Message(content="")
+    steps = {}
+
+    async for event in agent.astream_events(inputs, version="v2"):
+        kind = event["event"]
+        name = event["name"]
+        node = event.get("metadata", {}).get("langgraph_node")
+
+        if kind == "on_chain_start" and name in STEPS and name == node:
+            if name == "generate" and answer_msg.content:
+                # The previous draft was rejected by a grader, start over
+                await answer_msg.stream_token("", is_sequence=True)
+            label, step_type = STEPS[name]
+            step = cl.Step(name=label, type=step_type)
+            await step.send()
+            steps[event["run_id"]] = step
+
+        elif kind == "on_chain_end" and event["run_id"] in steps:
+            step = steps.pop(event["run_id"])
+            output = event["data"].get("output") or {}
+            if name == "retrieve":
+                step.output = f"{len(output.get('documents', []))} documents retrieved"
+            elif name == "grade_documents":
+                step.output = f"{len(output.get('documents', []))} documents relevant"
+            elif name == "transform_query":
+                step.output = output.get("question", "")
+            await step.update()
+
+        elif kind == "on_chat_model_stream" and "rag_answer" in event.get("tags", []):
+            await answer_msg.stream_token(event["data"]["chunk"].content)
+
+        elif kind == "on_chain_end" and name == "answer" and node == "answer":
+            value = event["data"]["output"]
             print("---" * 5)
-            print(f"{key}: {value}")
+            print(f"answer: {value}")
             print("---" * 5)
-            if key == "answer":
-                await cl.Message(content=value["generation"]).send()
+            answer_msg.content = value["generation"]
+            await answer_msg.send()
+            # Only answers that passed grading are cached
+            if not value["gave_up"]:
+                await cl.make_async(answer_cache.store)(
+                    message.content, value["generation"]
+                )
+    registry.report()
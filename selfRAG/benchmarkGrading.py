@@ -0,0 +1,137 @@
+import argparse
+import importlib
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Fixed questions over the circulars in ./circulars
+QUESTIONS = [
+    "To what investments do the concentration norms not apply?",
+    "Can FPIs invest in capital market securities?",
+    "Can FPIs invest in unlisted corporate debt securities?",
+    "What is the minimum residual maturity for FPI investment in corporate bonds?",
+    "Which circulars were withdrawn by the Reserve Bank of India?",
+    "What are the reporting requirements for FPI investments in debt securities?",
+]
+
+
+class TokenCounter(BaseCallbackHandler):
+    """
+    Count LLM calls and prompt / completion tokens reported by Ollama.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                self.calls += 1
+                info = generation.generation_info or {}
+                self.prompt_tokens += info.get("prompt_eval_count") or 0
+                self.completion_tokens += info.get("eval_count") or 0
+
+
+def per_document_grades(sra, question, documents, counter):
+    grader = sra.retrieval_grader_chain()
+    return [
+        grader.invoke(
+            {"question": question, "document": d.page_content},
+            config={"callbacks": [counter]},
+        )["score"]
+        for d in documents
+    ]
+
+
+def benchmark(sra, questions):
+    """
+    Compare per-document and batched relevance grading on a fixed question set.
+
+    Args:
+        sra (module): The self-RAG agent module to benchmark.
+        questions (list): The questions to grade retrieved documents for.
+
+    Returns:
+        dict: Calls, tokens and latency of each mode, the number of batched
+            fallbacks, and the grade agreement between the two modes.
+    """
+    results = {
+        mode: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0}
+        for mode in ("per-document", "batched")
+    }
+    agreed = 0
+    graded = 0
+    fallbacks = 0
+
+    for question in questions:
+        documents = sra.get_retriever().invoke(question)
+
+        counter = TokenCounter()
+        start = time.perf_counter()
+        reference = per_document_grades(sra, question, documents, counter)
+        elapsed = time.perf_counter() - start
+        _add(results["per-document"], counter, elapsed)
+
+        counter = TokenCounter()
+        start = time.perf_counter()
+        grades = sra.grade_batched(question, documents, config={"callbacks": [counter]})
+        if grades is None:
+            fallbacks += 1
+            grades = per_document_grades(sra, question, documents, counter)
+        elapsed = time.perf_counter() - start
+        _add(results["batched"], counter, elapsed)
+
+        agreed += sum(a == b for a, b in zip(reference, grades))
+        graded += len(documents)
+
+    return {
+        "modes": results,
+        "fallbacks": fallbacks,
+        "agreement": agreed / graded if graded else 1.0,
+    }
+
+
+def _add(totals, counter, elapsed):
+    totals["calls"] += counter.calls
+    totals["prompt_tokens"] += counter.prompt_tokens
+    totals["completion_tokens"] += counter.completion_tokens
+    totals["seconds"] += elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark batched against per-document relevance grading."
+    )
+    parser.add_argument(
+        "--agent",
+        choices=["selfRAGAgentHF", "selfRAGAgentOllama"],
+        default="selfRAGAgentHF",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Answer repeated LLM calls from the response cache instead of timing them",
+    )
+    args = parser.parse_args()
+
+    sra = importlib.import_module(args.agent)
+    # Off by default, a re-run would otherwise time SQLite hits
+    if sra.response_cache is not None:
+        sra.response_cache.enabled = args.cache
+    report = benchmark(sra, QUESTIONS)
+
+    print("---GRADING BENCHMARK---")
+    print(f"{len(QUESTIONS)} questions")
+    for mode, totals in report["modes"].items():
+        print(
+            f"{mode:<13} calls={totals['calls']:<4} "
+            f"prompt_tokens={totals['prompt_tokens']:<7} "
+            f"completion_tokens={totals['completion_tokens']:<6} "
+            f"latency={totals['seconds'] / len(QUESTIONS):.2f}s/question"
+        )
+    print(f"Batched fallbacks: {report['fallbacks']}")
+    print(f"Agreement with per-document grades: {report['agreement']:.1%}")
+    if args.cache and sra.response_cache is not None:
+        print(f"Response cache: {sra.response_cache.stats()}")
@@ -0,0 +1,129 @@
+import threading
+import time
+
+
+class ResourceRegistry:
+    """
+    Process-wide, lazily initialised store for expensive shared objects.
+
+    Embedding models, vector stores and retrievers are built once on first use
+    and then reused by every graph node, question and chat session. The registry
+    also keeps timing metrics so the saving from reuse is visible.
+
+    Attributes:
+        init_seconds: Time spent building each resource, keyed by resource key.
+        reuses: Number of times each resource was served without rebuilding it.
+        timings: Recorded durations of named operations, e.g. retrieval.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._resources = {}
+        self.init_seconds = {}
+        self.reuses = {}
+        self.timings = {}
+
+    def get_or_create(self, key, factory):
+        """
+        Return the resource stored under key, building it with factory on first use.
+
+        Concurrent first calls for the same key build the resource only once.
+
+        Args:
+            key (hashable): The resource key.
+            factory (callable): Builds the resource, called without arguments.
+
+        Returns:
+            The shared resource.
+        """
+        with self._lock:
+            if key in self._resources:
+                self.reuses[key] += 1
+                return self._resources[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._resources:
+                    self.reuses[key] += 1
+                    return self._resources[key]
+
+            start = time.perf_counter()
+            resource = factory()
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._resources[key] = resource
+                self.init_seconds[key] = elapsed
+                self.reuses[key] = 0
+            print(f"---INITIALISED {key} in {elapsed:.2f}s---")
+            return resource
+
+    def reset(self, key=None):
+        """
+        Drop one resource, or all of them, so the next use rebuilds it.
+
+        Args:
+            key (hashable): The resource key, or None for every resource.
+        """
+        with self._lock:
+            keys = [key] if key is not None else list(self._resources)
+            for k in keys:
+                self._resources.pop(k, None)
+
+    def record(self, name, seconds):
+        """
+        Record the duration of a named operation.
+
+        Args:
+            name (str): The operation name.
+            seconds (float): The measured duration.
+        """
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+    def metrics(self):
+        """
+        Summarise initialisation cost, reuse and the time saved by reusing.
+
+        Returns:
+            dict: Per-resource init time, reuse count and saved seconds, and the
+                count and mean of every recorded operation.
+        """
+        with self._lock:
+            resources = {
+                str(key): {
+                    "init_seconds": round(self.init_seconds[key], 3),
+                    "reuses": self.reuses[key],
+                    "saved_seconds": round(
+                        self.init_seconds[key] * self.reuses[key], 3
+                    ),
+                }
+                for key in self.init_seconds
+            }
+            timings = {
+                name: {
+                    "count": len(values),
+                    "mean_seconds": round(sum(values) / len(values), 3),
+                }
+                for name, values in self.timings.items()
+            }
+        return {"resources": resources, "timings": timings}
+
+    def report(self):
+        """
+        Print the metrics summary.
+        """
+        metrics = self.metrics()
+        print("---RESOURCE METRICS---")
+        for key, values in metrics["resources"].items():
+            print(
+                f"{key}: built in {values['init_seconds']}s, reused {values['reuses']} "
+                f"times, saved {values['saved_seconds']}s"
+            )
+        for name, values in metrics["timings"].items():
+            print(f"{name}: {values['count']} calls, {values['mean_seconds']}s mean")
+
+
+registry = ResourceRegistry()
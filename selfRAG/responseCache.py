@@ -0,0 +1,158 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+# Least recently used responses are evicted beyond this many entries
+MAX_ENTRIES = 50000
+
+
+class ResponseCache(BaseCache):
+    """
+    Persistent, size-bounded cache of LLM responses in a SQLite file.
+
+    Responses are keyed by a hash of the model settings and the prompt, so a
+    re-run after a crash or a code change only recomputes the calls whose
+    prompt or settings changed. Only safe for deterministic calls, i.e.
+    temperature 0, which is how every chain in the project runs.
+
+    Use it as the LangChain LLM cache (set_llm_cache or the cache argument of a
+    chat model), or through get / put for other clients such as Anthropic.
+
+    The SQLite file is only opened on first use, so importing a module that
+    configures a cache does not create it.
+
+    Attributes:
+        enabled: Set to False to bypass the cache, e.g. for timed benchmark
+            runs, without rebuilding the models that use it.
+        hits: Number of lookups answered from the cache.
+        misses: Number of lookups that were not.
+    """
+
+    def __init__(self, db_path, max_entries=MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        # Called with the lock held
+        if self._conn is None:
+            self._conn = sqlite3.connect(
+                self.db_path, check_same_thread=False, timeout=30
+            )
+            with self._conn:
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        used_at REAL NOT NULL
+                    )
+                    """)
+                self._conn.execute(
+                    "CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)"
+                )
+        return self._conn
+
+    def get(self, namespace, payload):
+        """
+        Return the cached response for a request, or None on a miss.
+
+        Args:
+            namespace (str): The model and settings of the request.
+            payload (str): The prompt or serialized request.
+
+        Returns:
+            str: The cached response, or None.
+        """
+        if not self.enabled:
+            return None
+        key = _key(namespace, payload)
+        with self._lock:
+            conn = self._db()
+            row = conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with conn:
+                conn.execute(
+                    "UPDATE responses SET used_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            self.hits += 1
+            return row[0]
+
+    def put(self, namespace, payload, value):
+        """
+        Cache the response to a request, evicting the least recently used
+        responses beyond max_entries.
+
+        Args:
+            namespace (str): The model and settings of the request.
+            payload (str): The prompt or serialized request.
+            value (str): The response.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock, self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (_key(namespace, payload), value, now, now),
+            )
+            conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def lookup(self, prompt, llm_string):
+        value = self.get(llm_string, prompt)
+        if value is None:
+            return None
+        return [loads(generation) for generation in json.loads(value)]
+
+    def update(self, prompt, llm_string, return_val):
+        self.put(
+            llm_string,
+            prompt,
+            json.dumps([dumps(generation) for generation in return_val]),
+        )
+
+    def clear(self, **kwargs):
+        with self._lock, self._db() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        """
+        The hit / miss counters and the number of cached responses.
+        """
+        with self._lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+def _key(namespace, payload):
+    digest = hashlib.sha256(namespace.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(payload.encode("utf-8"))
+    return digest.hexdigest()
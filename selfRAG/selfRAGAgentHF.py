@@ -1,13 +1,19 @@
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List
 
 from dotenv import load_dotenv
+from json_repair import repair_json
 from langchain.prompts import PromptTemplate
 from langchain_chroma import Chroma
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_ollama import ChatOllama
 from langgraph.graph import END, START, StateGraph
+from resources import registry
+from responseCache import ResponseCache
 from typing_extensions import TypedDict
 
 load_dotenv()
@@ -24,8 +30,112 @@ hallucination_grader_llm = "llama3.1"
 answer_grader_llm = "llama3.1"
 question_rewriter_llm = "llama3.1"
 
+# Generations allowed before answering even if the answer is not grounded
+max_iterations = 5
 
-def retrieval_grader_chain():
+embedding_model = "nomic-ai/nomic-embed-text-v1.5"
+chroma_directory = "./chroma"
+# Persistent cache of LLM responses for temperature 0 calls, next to this script
+# and created on first use. None disables it.
+response_cache_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "responseCache.sqlite3"
+)
+
+# "parallel" grades each document with its own call, "batched" grades all of
+# them in one call and falls back to "parallel" when the output is malformed
+grade_mode = "parallel"
+# Number of documents graded at the same time
+grade_max_concurrency = 4
+# Stop grading once this many documents are relevant, None grades them all
+grade_min_relevant = None
+
+
+response_cache = ResponseCache(response_cache_path) if response_cache_path else None
+
+
+def get_llm(model, format=None, temperature=0):
+    """
+    The shared ChatOllama client for a model and settings.
+
+    Every chain using the same model and settings goes through the same client.
+    langchain_ollama's ChatOllama holds one httpx client for sync calls and one
+    for async calls, so their keep-alive connections to the Ollama server are
+    reused across calls.
+    """
+    llm_kwargs = {"format": format} if format else {}
+    return registry.get_or_create(
+        ("llm", ollama_base_url, model, format, temperature),
+        lambda: ChatOllama(
+            base_url=ollama_base_url,
+            model=model,
+            temperature=temperature,
+            # Only deterministic calls can be answered from the cache
+            cache=response_cache if temperature == 0 else None,
+            **llm_kwargs,
+        ),
+    )
+
+
+def memoized_chain(name, build, model, temperature):
+    """
+    Build a chain once per model and settings and reuse it afterwards.
+    """
+    return registry.get_or_create(
+        ("chain", name, ollama_base_url, model, temperature),
+        lambda: build(model, temperature),
+    )
+
+
+def retrieval_grader_chain(model=None, temperature=0):
+    return memoized_chain(
+        "retrieval_grader",
+        build_retrieval_grader_chain,
+        model or retrieval_grader_llm,
+        temperature,
+    )
+
+
+def rag_chain(model=None, temperature=0):
+    return memoized_chain("rag", build_rag_chain, model or rag_chain_llm, temperature)
+
+
+def hallucination_grader_chain(model=None, temperature=0):
+    return memoized_chain(
+        "hallucination_grader",
+        build_hallucination_grader_chain,
+        model or hallucination_grader_llm,
+        temperature,
+    )
+
+
+def answer_grader_chain(model=None, temperature=0):
+    return memoized_chain(
+        "answer_grader",
+        build_answer_grader_chain,
+        model or answer_grader_llm,
+        temperature,
+    )
+
+
+def batch_retrieval_grader_chain(model=None, temperature=0):
+    return memoized_chain(
+        "batch_retrieval_grader",
+        build_batch_retrieval_grader_chain,
+        model or retrieval_grader_llm,
+        temperature,
+    )
+
+
+def question_rewriter_chain(model=None, temperature=0):
+    return memoized_chain(
+        "question_rewriter",
+        build_question_rewriter_chain,
+        model or question_rewriter_llm,
+        temperature,
+    )
+
+
+def build_retrieval_grader_chain(model, temperature):
     prompt = PromptTemplate(
         template="""You are a grader assessing relevance of a retrieved document to a user question. \n 
         Here is the retrieved document: \n\n {document} \n\n
@@ -37,19 +147,33 @@ def retrieval_grader_chain():
         input_variables=["question", "document"],
     )
 
-    llm = ChatOllama(
-        base_url=ollama_base_url,
-        model=retrieval_grader_llm,
-        format="json",
-        temperature=0,
-    )
+    llm = get_llm(model, format="json", temperature=temperature)
 
     retrieval_grader = prompt | llm | JsonOutputParser()
 
     return retrieval_grader
 
 
-def rag_chain():
+def build_batch_retrieval_grader_chain(model, temperature):
+    prompt = PromptTemplate(
+        template="""You are a grader assessing relevance of retrieved documents to a user question. \n 
+        Here are the retrieved documents, each starting with its number: \n\n {documents} \n\n
+        Here is the user question: {question} \n
+        If a document contains keywords related to the user question, grade it as relevant. \n
+        Use logic and understand the context of the question and each document to make decisions \n
+        Give a binary score 'yes' or 'no' for every document to indicate whether it is relevant to the question. \n
+        Provide the scores as a JSON with a single key 'scores' holding a list with one score per document, in document order, and no preamble or explanation.""",
+        input_variables=["question", "documents"],
+    )
+
+    llm = get_llm(model, format="json", temperature=temperature)
+
+    batch_retrieval_grader = prompt | llm | StrOutputParser()
+
+    return batch_retrieval_grader
+
+
+def build_rag_chain(model, temperature):
     prompt = PromptTemplate(
         template="""You are an legal question-answering agent. Use the following pieces of retrieved context which are part of circulars by the government and your experience to understand to create an answer relevant to the query containing all pertinent information required to answer the question. Make sure the answer is of an appropriate length containing specifics about the query's response. If you don't know the answer, just say that you don't know. Please only provide the answer in the output.
 
@@ -61,19 +185,15 @@ def rag_chain():
         input_variables=["question", "context"],
     )
 
-    llm = ChatOllama(
-        base_url=ollama_base_url,
-        model=rag_chain_llm,
-        # format="json",
-        temperature=0,
-    )
+    llm = get_llm(model, temperature=temperature)
 
-    rag = prompt | llm | StrOutputParser()
+    # Tagged so the app can stream the answer tokens and skip the graders'
+    rag = (prompt | llm | StrOutputParser()).with_config(tags=["rag_answer"])
 
     return rag
 
 
-def hallucination_grader_chain():
+def build_hallucination_grader_chain(model, temperature):
     prompt = PromptTemplate(
         template="""You are a grader assessing whether an answer is grounded in / supported by a set of facts. \n 
         Here are the facts:
@@ -86,19 +206,14 @@ def hallucination_grader_chain():
         input_variables=["generation", "documents"],
     )
 
-    llm = ChatOllama(
-        base_url=ollama_base_url,
-        model=hallucination_grader_llm,
-        format="json",
-        temperature=0,
-    )
+    llm = get_llm(model, format="json", temperature=temperature)
 
     hallucination_grader = prompt | llm | JsonOutputParser()
 
     return hallucination_grader
 
 
-def answer_grader_chain():
+def build_answer_grader_chain(model, temperature):
     prompt = PromptTemplate(
         template="""You are a grader assessing whether an answer is useful to resolve a question. \n 
         Here is the answer:
@@ -111,19 +226,14 @@ def answer_grader_chain():
         input_variables=["generation", "question"],
     )
 
-    llm = ChatOllama(
-        base_url=ollama_base_url,
-        model=answer_grader_llm,
-        format="json",
-        temperature=0,
-    )
+    llm = get_llm(model, format="json", temperature=temperature)
 
     answer_grader = prompt | llm | JsonOutputParser()
 
     return answer_grader
 
 
-def question_rewriter_chain():
+def build_question_rewriter_chain(model, temperature):
     prompt = PromptTemplate(
         template="""You a question re-writer that converts an input question to a better version that is optimized \n 
         for vectorstore retrieval. Look at the initial and formulate an improved question. \n
@@ -132,17 +242,57 @@ def question_rewriter_chain():
         input_variables=["generation", "question"],
     )
 
-    llm = ChatOllama(
-        base_url=ollama_base_url,
-        model=question_rewriter_llm,
-        temperature=0,
-    )
+    llm = get_llm(model, temperature=temperature)
 
     question_rewriter = prompt | llm | StrOutputParser()
 
     return question_rewriter
 
 
+def get_embeddings():
+    """
+    The shared embedding model, loaded once per process.
+    """
+    return registry.get_or_create(
+        ("embeddings", embedding_model),
+        lambda: HuggingFaceEmbeddings(
+            model_name=embedding_model,
+            model_kwargs={"device": "cuda", "trust_remote_code": True},
+        ),
+    )
+
+
+def get_vectorstore():
+    """
+    The shared Chroma client for the circulars collection.
+    """
+    return registry.get_or_create(
+        ("vectorstore", chroma_directory, embedding_model),
+        lambda: Chroma(
+            collection_name="rag-chroma",
+            persist_directory=chroma_directory,
+            embedding_function=get_embeddings(),
+        ),
+    )
+
+
+def get_retriever():
+    """
+    The shared retriever over the circulars collection.
+    """
+    return registry.get_or_create(
+        ("retriever", chroma_directory, embedding_model),
+        lambda: get_vectorstore().as_retriever(),
+    )
+
+
+def warm_up():
+    """
+    Build the shared retrieval resources ahead of the first question.
+    """
+    get_retriever()
+
+
 class GraphState(TypedDict):
     """
     Represents the state of our graph.
@@ -152,12 +302,15 @@ class GraphState(TypedDict):
         generation: LLM generation
         documents: list of documents
         iterations: number of iterations
+        gave_up: whether the answer was given after max_iterations generations
+            that were not grounded in the documents
     """
 
     question: str
     generation: str
     documents: List[str]
     iterations: int
+    gave_up: bool
 
 
 def retrieve(state):
@@ -173,20 +326,10 @@ def retrieve(state):
     print("---RETRIEVE---")
     question = state["question"]
 
-    embeddings = HuggingFaceEmbeddings(
-        model_name="nomic-ai/nomic-embed-text-v1.5",
-        model_kwargs={"device": "cuda", "trust_remote_code": True},
-    )
-
-    docsearch = Chroma(
-        collection_name="rag-chroma",
-        persist_directory="./chroma",
-        embedding_function=embeddings,
-    )
-
-    retriever = docsearch.as_retriever()
+    start = time.perf_counter()
+    documents = get_retriever().invoke(question)
+    registry.record("retrieve", time.perf_counter() - start)
 
-    documents = retriever.invoke(question)
     return {"documents": documents, "question": question}
 
 
@@ -234,21 +377,131 @@ def grade_documents(state):
     question = state["question"]
     documents = state["documents"]
 
-    retrieval_grader = retrieval_grader_chain()
-
-    filtered_docs = []
-    for d in documents:
-        score = retrieval_grader.invoke(
-            {"question": question, "document": d.page_content}
+    grades = None
+    if grade_mode == "batched":
+        grades = grade_batched(question, documents)
+    if grades is None:
+        grades = grade_concurrently(
+            retrieval_grader_chain(),
+            question,
+            documents,
+            max_concurrency=grade_max_concurrency,
+            min_relevant=grade_min_relevant,
         )
-        grade = score["score"]
+    filtered_docs = [d for d, grade in zip(documents, grades) if grade == "yes"]
+    return {"documents": filtered_docs, "question": question}
+
+
+def grade_concurrently(
+    retrieval_grader, question, documents, max_concurrency=4, min_relevant=None
+):
+    """
+    Grade documents in parallel, keeping the grades in document order.
+
+    Args:
+        retrieval_grader: The retrieval grader chain.
+        question (str): The user question.
+        documents (list): The retrieved documents.
+        max_concurrency (int): Maximum number of grader calls in flight.
+        min_relevant (int): Stop once this many documents are relevant. Documents
+            not graded by then get no grade.
+
+    Returns:
+        list: The 'yes' / 'no' grade of each document, None when not graded.
+    """
+    grades = [None] * len(documents)
+    if not documents:
+        return grades
+
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    futures = {
+        executor.submit(
+            retrieval_grader.invoke, {"question": question, "document": d.page_content}
+        ): i
+        for i, d in enumerate(documents)
+    }
+    relevant = 0
+    try:
+        for future in as_completed(futures):
+            grade = future.result()["score"]
+            grades[futures[future]] = grade
+            if grade == "yes":
+                print("---GRADE: DOCUMENT RELEVANT---")
+                relevant += 1
+                if min_relevant and relevant >= min_relevant:
+                    print("---GRADE: ENOUGH RELEVANT DOCUMENTS, STOP GRADING---")
+                    break
+            else:
+                print("---GRADE: DOCUMENT NOT RELEVANT---")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return grades
+
+
+def grade_batched(question, documents, config=None):
+    """
+    Grade all documents with a single grader call.
+
+    Args:
+        question (str): The user question.
+        documents (list): The retrieved documents.
+        config (dict): Optional runnable config, e.g. callbacks.
+
+    Returns:
+        list: The 'yes' / 'no' grade of each document, or None when the output
+            does not hold exactly one valid score per document.
+    """
+    if not documents:
+        return []
+
+    numbered = "\n\n".join(
+        f"Document {i + 1}:\n{d.page_content}" for i, d in enumerate(documents)
+    )
+    output = batch_retrieval_grader_chain().invoke(
+        {"question": question, "documents": numbered}, config=config
+    )
+    grades = parse_batch_scores(output, len(documents))
+    if grades is None:
+        print("---GRADE: MALFORMED BATCH SCORES, GRADING EACH DOCUMENT---")
+        return None
+
+    for grade in grades:
         if grade == "yes":
             print("---GRADE: DOCUMENT RELEVANT---")
-            filtered_docs.append(d)
         else:
             print("---GRADE: DOCUMENT NOT RELEVANT---")
-            continue
-    return {"documents": filtered_docs, "question": question}
+    return grades
+
+
+def parse_batch_scores(output, count):
+    """
+    Parse the batched grader output into one 'yes' / 'no' per document.
+
+    Args:
+        output (str): The raw grader output.
+        count (int): The number of graded documents.
+
+    Returns:
+        list: The grades, or None when the output is malformed.
+    """
+    try:
+        scores = json.loads(repair_json(output))
+    except ValueError:
+        return None
+    if isinstance(scores, dict):
+        scores = scores.get("scores")
+    if not isinstance(scores, list) or len(scores) != count:
+        return None
+
+    grades = []
+    for score in scores:
+        if isinstance(score, dict):
+            score = score.get("score")
+        score = str(score).strip().lower()
+        if score not in ("yes", "no"):
+            return None
+        grades.append(score)
+    return grades
 
 
 def transform_query(state):
@@ -334,7 +587,7 @@ def grade_generation_v_documents_and_question(state):
             print("---DECISION: GENERATION DOES NOT ADDRESS QUESTION---")
             return "not useful"
     else:
-        if state["iterations"] >= 5:
+        if state["iterations"] >= max_iterations:
             return "stop"
         else:
             print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-TRY---")
@@ -342,6 +595,21 @@ def grade_generation_v_documents_and_question(state):
             return "not supported"
 
 
+def give_up(state):
+    """
+    Stop retrying after max_iterations generations that were not grounded
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): Sets gave_up, so the answer is not cached
+    """
+
+    print("---DECISION: MAX ITERATIONS REACHED, ANSWERING ANYWAY---")
+    return {"gave_up": True}
+
+
 def answer(state):
     """
     Return the answer
@@ -367,6 +635,7 @@ def selfRAGAgent():
     workflow.add_node("grade_documents", grade_documents)
     workflow.add_node("generate", generate)
     workflow.add_node("transform_query", transform_query)
+    workflow.add_node("give_up", give_up)
     workflow.add_node("answer", answer)
 
     # Build graph
@@ -388,9 +657,10 @@ def selfRAGAgent():
             "not supported": "generate",
             "useful": "answer",
             "not useful": "transform_query",
-            "stop": "answer",
+            "stop": "give_up",
         },
     )
+    workflow.add_edge("give_up", "answer")
     workflow.add_edge("answer", END)
 
     app = workflow.compile()